@@ -0,0 +1,126 @@
+import asyncio
+import heapq
+import itertools
+import math
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; status_code is 429 (queue full) or 503 (queue deadline)."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded, priority-ordered wait queue.
+
+    At most max_concurrency requests run at once; up to max_queue more wait, highest
+    priority first, for at most queue_timeout seconds. A full queue sheds the arrival
+    with 429 unless it outranks the lowest-priority waiter, which is then shed instead.
+    Waiters whose deadline passes are shed with 503. Must be used from a single event loop.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float, retry_after: float = 1.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._active = 0
+        self._queued = 0
+        self._waiters: List[list] = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.shed_displaced = 0
+
+    def _retry_after(self) -> int:
+        # rough time for the current backlog to drain, never less than the configured floor
+        backlog = (self._queued + 1) / self.max_concurrency
+        return max(1, math.ceil(max(self.retry_after, backlog * self.retry_after)))
+
+    def _displace_lowest(self, priority: int) -> bool:
+        live = [w for w in self._waiters if not w[2].done()]
+        if not live:
+            return False
+        worst = max(live, key=lambda w: (w[0], w[1]))
+        if worst[0] <= priority:
+            return False
+        worst[2].set_exception(AdmissionRejected(429, "displaced by higher-priority request", self._retry_after()))
+        self._queued -= 1
+        self.shed_displaced += 1
+        return True
+
+    async def acquire(self, priority: str = "normal"):
+        rank = PRIORITIES.get(priority, PRIORITIES["normal"])
+        if self._active < self.max_concurrency and self._queued == 0:
+            self._active += 1
+            self.admitted += 1
+            return
+        if self._queued >= self.max_queue and not self._displace_lowest(rank):
+            self.shed_queue_full += 1
+            raise AdmissionRejected(429, "admission queue full", self._retry_after())
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [rank, next(self._seq), fut])
+        self._queued += 1
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                if fut.exception() is not None:
+                    raise fut.exception()
+                # the slot was handed over just as the deadline passed
+                self.admitted += 1
+                return
+            self._queued -= 1
+            self.shed_timeout += 1
+            raise AdmissionRejected(503, "timed out waiting for admission", self._retry_after())
+        except asyncio.CancelledError:
+            # caller went away: give back a slot we were handed, or leave the queue
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self.release()
+            elif not fut.done() or fut.cancelled():
+                self._queued -= 1
+            raise
+        self.admitted += 1
+
+    def release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                continue
+            # hand the slot straight to the next waiter; _active stays the same
+            self._queued -= 1
+            fut.set_result(None)
+            return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "normal"):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "queue_depth": self._queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "shed_displaced": self.shed_displaced,
+        }
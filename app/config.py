@@ -5,12 +5,51 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./data.db")
 
+    # --- Database pooling / SQLite tuning ---
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-64000"))  # negative = KiB
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+    # --- Admission control (verification endpoints) ---
+    # scoring is CPU-bound under the GIL, so a few workers keep the event loop responsive
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "2"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2.0"))
+    ADMISSION_RETRY_AFTER_SECONDS: float = float(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1.0"))
+
+    # --- Match-result memoization (per cache) ---
+    MATCH_CACHE_MAX_BYTES: int = int(os.getenv("MATCH_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    MATCH_CACHE_TTL_SECONDS: float = float(os.getenv("MATCH_CACHE_TTL_SECONDS", "300"))
+    # serialized GET /ledger pages, same TTL
+    LEDGER_RESPONSE_CACHE_MAX_BYTES: int = int(os.getenv("LEDGER_RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+    # --- Account-sharded matching (0 = shards kept in-process) ---
+    MATCH_SHARD_WORKERS: int = int(os.getenv("MATCH_SHARD_WORKERS", "0"))
+
     # --- Mailtrap API (no IMAP anymore) ---
-    MAILTRAP_API_URL: str = os.getenv("MAILTRAP_API_URL", "https://sandbox.api.mailtrap.io/api/send")
     MAILTRAP_API_TOKEN: str = os.getenv("MAILTRAP_API_TOKEN", "")
     MAILTRAP_INBOX_ID: str = os.getenv("MAILTRAP_INBOX_ID", "")
+    MAILTRAP_ACCOUNT_ID: str = os.getenv("MAILTRAP_ACCOUNT_ID", "")
+    MAILTRAP_INBOX_API_URL: str = os.getenv("MAILTRAP_INBOX_API_URL", "https://mailtrap.io/api")
+    MAILTRAP_FETCH_CONCURRENCY: int = int(os.getenv("MAILTRAP_FETCH_CONCURRENCY", "8"))
+    MAILTRAP_MAX_PAGES: int = int(os.getenv("MAILTRAP_MAX_PAGES", "200"))
+    MAILTRAP_TIMEOUT_SECONDS: float = float(os.getenv("MAILTRAP_TIMEOUT_SECONDS", "10"))
+
+    # --- IMAP (used by email_reader) ---
+    IMAP_HOST: str = os.getenv("IMAP_HOST", "")
+    IMAP_PORT: int = int(os.getenv("IMAP_PORT", "993"))
+    IMAP_USER: str = os.getenv("IMAP_USER", "")
+    IMAP_PASS: str = os.getenv("IMAP_PASS", "")
+    IMAP_USE_SSL: bool = os.getenv("IMAP_USE_SSL", "1") == "1"
+    IMAP_POLL_INTERVAL_SECONDS: float = float(os.getenv("IMAP_POLL_INTERVAL_SECONDS", "60"))
 
     # --- Transaction polling ---
+    # background refresh started by the app's lifespan; 0 disables it
     TRANSACTIONS_POLL_INTERVAL_SECONDS: int = int(os.getenv("TRANSACTIONS_POLL_INTERVAL_SECONDS", "900"))
     TRANSACTIONS_SOURCE: str = os.getenv("TRANSACTIONS_SOURCE", "sample")
     TRANSACTIONS_API_URL: str = os.getenv("TRANSACTIONS_API_URL", "")
@@ -23,9 +62,12 @@ class Settings(BaseSettings):
 
     # --- LLM enrichment ---
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
+    GEMINI_API_URL: str = os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent")
+    # ask Gemini for the amount/merchant/reference when the regex parser misses them (off by default)
+    GEMINI_FALLBACK_ENABLED: bool = os.getenv("GEMINI_FALLBACK_ENABLED", "") == "1"
 
     # --- Admin ---
     TELEX_AGENT_ADMIN: bool = os.getenv("TELEX_AGENT_ADMIN", "") == "1"
 
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
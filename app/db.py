@@ -1,10 +1,101 @@
-from sqlmodel import SQLModel, create_engine, Session
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from .config import settings
 
-engine = create_engine(settings.DATABASE_URL, echo=False, connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {})
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def async_database_url(url: str) -> str:
+    """Maps a sync DATABASE_URL onto its async driver (aiosqlite for SQLite, asyncpg for Postgres)."""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+def _engine_kwargs(url: str) -> dict:
+    if is_sqlite(url):
+        connect_args = {"check_same_thread": False}
+        if ":memory:" in url or url.rstrip("/").endswith(":"):
+            # every connection to an in-memory database is a new, empty database
+            return {"connect_args": connect_args, "poolclass": StaticPool}
+        connect_args["timeout"] = settings.SQLITE_BUSY_TIMEOUT_MS / 1000.0
+        return {
+            "connect_args": connect_args,
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        }
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": True,
+    }
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def build_engine(url: str, tune_sqlite: bool = True):
+    """Sync engine with the configured pool; SQLite connections get WAL/synchronous/cache pragmas."""
+    eng = create_engine(url, echo=False, **_engine_kwargs(url))
+    if tune_sqlite and is_sqlite(url):
+        event.listen(eng, "connect", _apply_sqlite_pragmas)
+    return eng
+
+def build_async_engine(url: str, tune_sqlite: bool = True) -> AsyncEngine:
+    """Async counterpart of build_engine (aiosqlite / asyncpg)."""
+    url = async_database_url(url)
+    eng = create_async_engine(url, echo=False, **_engine_kwargs(url))
+    if tune_sqlite and is_sqlite(url):
+        event.listen(eng.sync_engine, "connect", _apply_sqlite_pragmas)
+    return eng
+
+engine = build_engine(settings.DATABASE_URL)
+async_engine = build_async_engine(settings.DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+def _create_schema(conn):
+    SQLModel.metadata.create_all(conn)
+    # create_all skips tables that already exist, along with any index added to them since
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
 
 def init_db():
-    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        _create_schema(conn)
+
+async def init_db_async():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(_create_schema)
+
+@asynccontextmanager
+async def async_session_scope() -> AsyncIterator[AsyncSession]:
+    """Async session that commits on success, rolls back on error and is always closed."""
+    async with AsyncSessionLocal() as sess:
+        try:
+            yield sess
+            await sess.commit()
+        except Exception:
+            await sess.rollback()
+            raise
 
-def get_session():
-    return Session(engine)
\ No newline at end of file
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency yielding a context-managed async session."""
+    async with async_session_scope() as sess:
+        yield sess
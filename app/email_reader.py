@@ -24,6 +24,7 @@ async def fetch_and_process():
         if resp.lines and resp.lines[0]:
             ids = resp.lines[0].split()
             for id_ in ids:
+                id_ = id_.decode() if isinstance(id_, (bytes, bytearray)) else id_
                 fetch_resp = await client.fetch(id_, "(RFC822)")
                 raw = b"".join(fetch_resp.lines[1:-1])
                 msg = email.message_from_bytes(raw)
@@ -1,51 +1,237 @@
-import requests
-import json
+import asyncio
+import httpx
 from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
 from .config import settings
+from .db import async_session_scope
+from .models import MailCursor
 
 
-def fetch_mailtrap_messages():
+class AlreadyIngested(Exception):
+    """The message was already claimed by another poll, possibly in another process."""
+
+
+async def load_mail_cursor(source: str) -> int:
+    """The stored last-seen message id of `source` (0 before its first message)."""
+    async with async_session_scope() as sess:
+        row = await sess.get(MailCursor, source)
+        if row is not None:
+            return row.last_seen_id
+    try:
+        async with async_session_scope() as sess:
+            sess.add(MailCursor(source=source))
+    except IntegrityError:
+        pass  # created concurrently by another process
+    return 0
+
+async def claim_message(sess: AsyncSession, source: str, message_id: int):
     """
-    Simulate fetching emails using the Mailtrap Sandbox API.
-    (Mailtrap Sandbox only supports sending test emails; this mock simulates the inbox.)
+    Moves the cursor of `source` to `message_id` inside the caller's transaction, so the
+    cursor and the ingested alert commit (or roll back) together. Raises AlreadyIngested
+    when the cursor is already there, which rolls the caller's writes back.
     """
+    result = await sess.exec(
+        update(MailCursor)
+        .where(MailCursor.source == source, MailCursor.last_seen_id < message_id)
+        .values(last_seen_id=message_id)
+    )
+    if result.rowcount == 0:
+        raise AlreadyIngested(f"{source} message {message_id}")
 
-    url = f"{settings.MAILTRAP_API_URL}/{settings.MAILTRAP_INBOX_ID}"
-    headers = {
-        "Authorization": f"Bearer {settings.MAILTRAP_API_TOKEN}",
-        "Content-Type": "application/json"
-    }
-
-    # Compose a mock test email
-    payload = {
-        "from": {"email": "noreply@bank.com", "name": "Demo Bank Alerts"},
-        "to": [{"email": "demo@telex.local"}],
-        "subject": "Bank Alert: Transaction at STARBUCKS $5.75",
-        "text": (
-            "Dear Customer,\n\n"
-            "Your account was just charged $5.75 at STARBUCKS on 2025-11-03.\n"
-            "If this wasn’t you, please contact us immediately.\n\n"
-            "– Demo Bank"
-        ),
-        "category": "Transaction Alerts"
-    }
 
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Sent test email to Mailtrap Sandbox successfully.")
-    except Exception as e:
-        print(f"[ERROR] Failed to send test email to Mailtrap Sandbox: {e}")
+class MailtrapInboxReader:
+    """
+    Reads new messages from a Mailtrap sandbox inbox through the REST API.
+
+    Message lists are walked page by page (newest first) until a page reaches the
+    last-seen message id, while plain-text bodies are downloaded concurrently over one
+    pooled client, at most `concurrency` at a time. poll() moves the last-seen id past a
+    message only once its handler has succeeded, so a failed download or ingest is retried
+    on the next poll.
+
+    With a `cursor_source`, the last-seen id is read from the MailCursor table at the
+    start of every poll, and the handler is expected to claim each message with
+    claim_message() in the transaction that ingests it. Restarts and other worker
+    processes then pick up where the last successful ingest left off, and a message that
+    another process claimed first is skipped.
+    """
+
+    def __init__(
+        self,
+        account_id: str,
+        inbox_id: str,
+        api_token: str,
+        base_url: str = "https://mailtrap.io/api",
+        concurrency: int = 8,
+        max_pages: int = 200,
+        timeout: float = 10.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        cursor_source: Optional[str] = None,
+    ):
+        self.inbox_path = f"/accounts/{account_id}/inboxes/{inbox_id}/messages"
+        self.concurrency = max(1, concurrency)
+        self.max_pages = max_pages
+        self.last_seen_id: Optional[int] = None
+        self.cursor_source = cursor_source
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers={"Api-Token": api_token, "Accept": "application/json"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            transport=transport,
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._poll_lock = asyncio.Lock()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _list_page(self, page: int) -> List[Dict[str, Any]]:
+        r = await self._client.get(self.inbox_path, params={"page": page})
+        r.raise_for_status()
+        return r.json()
 
-    # Simulated return payload (normally this would come from IMAP or Mailtrap API)
-    return [{
-        "subject": payload["subject"],
-        "sender": payload["from"]["email"],
-        "body": payload["text"],
-        "timestamp": datetime.now().isoformat()
-    }]
+    async def _fetch_body(self, message_id: int) -> str:
+        async with self._semaphore:
+            r = await self._client.get(f"{self.inbox_path}/{message_id}/body.txt")
+            r.raise_for_status()
+            return r.text
+
+    async def fetch_new(self) -> List[Dict[str, Any]]:
+        """
+        Returns messages newer than the last-seen id, oldest first, as ingestion payloads,
+        stopping before the first one whose body could not be fetched.
+
+        Listing always continues down to the last-seen id, so no message is skipped. When
+        the new mail spans more than `max_pages` pages, only the oldest `max_pages` pages'
+        worth is returned and the rest is left for later polls.
+        """
+        listed: List[Dict[str, Any]] = []
+        bodies: Dict[int, asyncio.Task] = {}
+        ids = set()
+        batch: Optional[int] = None
+        try:
+            page = 1
+            while True:
+                items = await self._list_page(page)
+                if not items:
+                    break
+                reached_seen = False
+                for item in items:
+                    msg_id = int(item["id"])
+                    if self.last_seen_id is not None and msg_id <= self.last_seen_id:
+                        reached_seen = True
+                        continue
+                    if msg_id in ids:
+                        continue  # shifted onto the next page by newly arrived mail
+                    ids.add(msg_id)
+                    listed.append(item)
+                    if batch is None:
+                        # start downloading while later pages are still being listed
+                        bodies[msg_id] = asyncio.create_task(self._fetch_body(msg_id))
+                if reached_seen:
+                    break
+                if self.max_pages and page == self.max_pages:
+                    batch = len(listed)
+                page += 1
+
+            listed.sort(key=lambda m: int(m["id"]))
+            if batch is not None and len(listed) > batch:
+                print(f"[MAILTRAP] {len(listed)} new messages span more than {self.max_pages} pages; "
+                      f"fetching the oldest {batch} now and the rest on later polls")
+                listed = listed[:batch]
+                keep = {int(m["id"]) for m in listed}
+                dropped = [bodies.pop(msg_id) for msg_id in list(bodies) if msg_id not in keep]
+                for task in dropped:
+                    task.cancel()
+                await asyncio.gather(*dropped, return_exceptions=True)
+                for msg_id in sorted(keep - bodies.keys()):
+                    bodies[msg_id] = asyncio.create_task(self._fetch_body(msg_id))
+        except BaseException:
+            for task in bodies.values():
+                task.cancel()
+            await asyncio.gather(*bodies.values(), return_exceptions=True)
+            raise
+
+        results = await asyncio.gather(*bodies.values(), return_exceptions=True)
+        body_by_id = dict(zip(bodies.keys(), results))
+
+        messages = []
+        for item in listed:
+            msg_id = int(item["id"])
+            body = body_by_id[msg_id]
+            if isinstance(body, BaseException):
+                print(f"[MAILTRAP] Failed to fetch body of message {msg_id}: {body}")
+                break
+            messages.append({
+                "id": msg_id,
+                "subject": item.get("subject"),
+                "sender": item.get("from_email"),
+                "body": body,
+                "timestamp": item.get("created_at"),
+            })
+        return messages
+
+    async def poll(self, handle: Callable[[Dict[str, Any]], Awaitable[Any]]) -> List[Dict[str, Any]]:
+        """
+        Fetches new mail and passes each message to `handle`, oldest first. The first failing
+        message stops the poll and is fetched again next time; a message the handler reports
+        as AlreadyIngested is passed over. Polls of this reader never overlap. Returns the
+        messages that were handled.
+        """
+        async with self._poll_lock:
+            if self.cursor_source is not None:
+                stored = await load_mail_cursor(self.cursor_source)
+                self.last_seen_id = max(self.last_seen_id or 0, stored)
+            handled = []
+            for message in await self.fetch_new():
+                try:
+                    await handle(message)
+                except AlreadyIngested:
+                    self.last_seen_id = message["id"]
+                    continue
+                except Exception as e:
+                    print(f"[MAILTRAP] Failed to ingest message {message['id']}: {e}")
+                    break
+                self.last_seen_id = message["id"]
+                handled.append(message)
+            return handled
+
+
+_reader: Optional[MailtrapInboxReader] = None
+
+def get_inbox_reader() -> MailtrapInboxReader:
+    """Process-wide reader, so the pooled client survives between polls; the last-seen id lives in the DB."""
+    global _reader
+    if _reader is None:
+        _reader = MailtrapInboxReader(
+            settings.MAILTRAP_ACCOUNT_ID,
+            settings.MAILTRAP_INBOX_ID,
+            settings.MAILTRAP_API_TOKEN,
+            base_url=settings.MAILTRAP_INBOX_API_URL,
+            concurrency=settings.MAILTRAP_FETCH_CONCURRENCY,
+            max_pages=settings.MAILTRAP_MAX_PAGES,
+            timeout=settings.MAILTRAP_TIMEOUT_SECONDS,
+            cursor_source=f"mailtrap:{settings.MAILTRAP_ACCOUNT_ID}:{settings.MAILTRAP_INBOX_ID}",
+        )
+    return _reader
+
+async def close_inbox_reader():
+    global _reader
+    if _reader is not None:
+        await _reader.aclose()
+        _reader = None
 
 
 if __name__ == "__main__":
-    messages = fetch_mailtrap_messages()
-    print(f"Fetched {len(messages)} test messages.")
\ No newline at end of file
+    async def _main():
+        try:
+            messages = await get_inbox_reader().fetch_new()
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Fetched {len(messages)} new messages.")
+        finally:
+            await close_inbox_reader()
+
+    asyncio.run(_main())
@@ -1,11 +1,11 @@
-import os, httpx
+import os, httpx, json
 from .config import settings
 
 async def enrich_with_gemini(prompt: str):
     if not settings.GEMINI_API_KEY:
         return None
     # Placeholder: call Gemini REST API — user must provide actual endpoint/auth per their key
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
+    url = settings.GEMINI_API_URL
     headers = {"Content-Type": "application/json"}
     payload = {
         "contents": [{
@@ -18,4 +18,21 @@ async def enrich_with_gemini(prompt: str):
         r = await client.post(f"{url}?key={settings.GEMINI_API_KEY}", json=payload, headers=headers)
         if r.status_code != 200:
             return None
-        return r.json()
\ No newline at end of file
+        return r.json()
+
+async def extract_alert_fields(email_text: str):
+    """Asks Gemini for amount/merchant/reference as JSON; returns a dict or None."""
+    prompt = (
+        "Extract the transaction amount (number), merchant and reference from this bank alert. "
+        "Reply with JSON only, using the keys amount, merchant and reference.\n\n" + email_text
+    )
+    resp = await enrich_with_gemini(prompt)
+    if not resp:
+        return None
+    try:
+        text = resp["candidates"][0]["content"]["parts"][0]["text"]
+        text = text.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+        fields = json.loads(text)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+    return fields if isinstance(fields, dict) else None
@@ -1,27 +1,57 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 import random
 import re
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Literal, Optional, Tuple
+import threading
+import orjson
+import httpx
 from rapidfuzz import fuzz
-from .db import get_session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .db import init_db_async, async_session_scope, get_async_session
 from .models import EmailAlert, MatchRun
-from .poller import get_recent_transactions
-from .matcher import choose_best
+from .poller import get_recent_transactions, recent_cutoff
+from . import poller
+from .matcher import rank
+from .match_cache import ledger_match_cache, ledger_response_cache, ingest_match_cache, normalize_merchant
+from .shards import account_shards, alert_account_key
+from .merchant_index import MerchantIndex, normalize_description
 from datetime import datetime
 import json
 import uuid
 import asyncio
-from .email_reader_mailtrap import fetch_mailtrap_messages
+from .email_reader_mailtrap import claim_message, get_inbox_reader, close_inbox_reader
+from .email_parser import parse_email
+from .config import settings
+from .gemini_client import extract_alert_fields
+from .telex_client import send_telex_message
+from .admission import AdmissionController, AdmissionRejected
 
 
 # --- CONFIGURATION AND DATA SETUP ---
 
 # Use a global dictionary to simulate the in-memory ledger database
 TRANSACTION_LEDGER: Dict[str, Dict[str, Any]] = {}
+# Distinct ledger descriptions, swapped in together with TRANSACTION_LEDGER
+LEDGER_MERCHANT_INDEX = MerchantIndex()
 ACCURACY_THRESHOLD = 0.80
+# Amount and time window give at most 0.60, so a row whose description ratio is below ~48.75
+# cannot round up to the threshold; such rows are not fuzzy-compared (see verify_alert)
+DESC_SIMILARITY_CUTOFF = 48.0
+# The most an uncompared row's exact score can exceed its index score (description weight
+# times the cutoff, plus rounding of both scores)
+DESC_CUTOFF_HEADROOM = 0.40 * DESC_SIMILARITY_CUTOFF / 100 + 0.01
+
+# Bumped on every ledger mutation; keys the /ledger ETag and serialized-response cache
+LEDGER_GENERATION = 0
+_LEDGER_LOCK = threading.Lock()
+_LEDGER_SNAPSHOT: Tuple[int, List[Dict[str, Any]]] = (-1, [])
 
 # --- DATA MODELS ---
 
@@ -36,6 +66,7 @@ class PolledTransaction(BaseModel):
 class AlertRequest(BaseModel):
     """The input payload representing the simulated bank alert email (The A2A Task)."""
     email_content: str
+    priority: Literal["high", "normal", "low"] = "normal"
 
 class AgentArtifact(BaseModel):
     """The structured output returned by the Agent (The A2A Artifact)."""
@@ -49,8 +80,10 @@ class AgentArtifact(BaseModel):
 # --- MOCK LEDGER GENERATION ---
 
 def generate_mock_ledger(count: int = 5):
-    """Fills the in-memory ledger with mock data, simulating the 15-minute poll."""
-    global TRANSACTION_LEDGER
+    """
+    Fills the in-memory ledger with mock data, simulating the 15-minute poll.
+    The new ledger is built aside and published in one step, so readers never see it half filled.
+    """
     mock_data = {
         "AMAZONPRCH": [50.99, 125.45],
         "STARBUCKS": [4.50, 6.75, 12.00],
@@ -59,8 +92,9 @@ def generate_mock_ledger(count: int = 5):
         "REFUNDXYZ": [-20.00, -5.50],
     }
 
-    TRANSACTION_LEDGER.clear()
-    
+    ledger: Dict[str, Dict[str, Any]] = {}
+    merchants = MerchantIndex()
+
     for i in range(count):
         description_key = random.choice(list(mock_data.keys()))
         amount = random.choice(mock_data[description_key])
@@ -75,9 +109,43 @@ def generate_mock_ledger(count: int = 5):
             description=description_key,
             polled_at=poll_time
         )
-        TRANSACTION_LEDGER[tx_id] = tx.model_dump()
-    
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] Ledger Mocked/Polled with {len(TRANSACTION_LEDGER)} entries.")
+        ledger[tx_id] = tx.model_dump()
+        merchants.add(description_key)
+
+    bump_ledger_generation(ledger, merchants)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Ledger Mocked/Polled with {len(ledger)} entries.")
+
+def bump_ledger_generation(
+    ledger: Optional[Dict[str, Dict[str, Any]]] = None,
+    merchants: Optional[MerchantIndex] = None,
+) -> int:
+    """
+    Marks the ledger as changed, invalidating cached /ledger responses and match results.
+    A replacement `ledger` and its `merchants` index, when given, are installed in the same step.
+    """
+    global LEDGER_GENERATION, TRANSACTION_LEDGER, LEDGER_MERCHANT_INDEX
+    with _LEDGER_LOCK:
+        if ledger is not None:
+            TRANSACTION_LEDGER = ledger
+            LEDGER_MERCHANT_INDEX = merchants if merchants is not None else MerchantIndex()
+        LEDGER_GENERATION += 1
+        ledger_response_cache.clear()
+        ledger_match_cache.clear()
+        return LEDGER_GENERATION
+
+def ledger_snapshot() -> Tuple[int, List[Dict[str, Any]]]:
+    """Returns (generation, entries sorted by tx_id), rebuilt at most once per generation."""
+    global _LEDGER_SNAPSHOT
+    with _LEDGER_LOCK:
+        if _LEDGER_SNAPSHOT[0] != LEDGER_GENERATION:
+            entries = [dict(TRANSACTION_LEDGER[k]) for k in sorted(TRANSACTION_LEDGER)]
+            _LEDGER_SNAPSHOT = (LEDGER_GENERATION, entries)
+        return _LEDGER_SNAPSHOT
+
+def ledger_state() -> Tuple[int, Dict[str, Dict[str, Any]], MerchantIndex]:
+    """The current (generation, ledger, merchant index), read together."""
+    with _LEDGER_LOCK:
+        return LEDGER_GENERATION, TRANSACTION_LEDGER, LEDGER_MERCHANT_INDEX
 
 # Initialize the ledger on startup
 generate_mock_ledger()
@@ -120,11 +188,12 @@ def parse_email_alert(email_text: str) -> Dict[str, Any]:
 
     return alert_data
 
-def calculate_match_score(alert: Dict[str, Any], polled: Dict[str, Any]) -> float:
+def calculate_match_score(alert: Dict[str, Any], polled: Dict[str, Any], desc_similarity: Optional[float] = None) -> float:
     """
     Calculates a match score using an 80% accuracy heuristic.
     Weights: Amount (45%), Description (40%), Polling Time Window (15%).
-    Uses fuzzy matching for better description similarity.
+    Uses fuzzy matching for better description similarity, unless a precomputed
+    `desc_similarity` (0..1) is passed in.
     """
     score = 0.0
 
@@ -142,11 +211,11 @@ def calculate_match_score(alert: Dict[str, Any], polled: Dict[str, Any]) -> floa
     # --- Weight 2: Description Match (40%) ---
     DESC_WEIGHT = 0.40
     if alert.get("description") and polled.get("description"):
-        # Normalize to lowercase for fuzz ratio
-        alert_desc = str(alert["description"]).lower().strip()
-        polled_desc = str(polled["description"]).lower().strip()
-
-        desc_similarity = fuzz.ratio(alert_desc, polled_desc) / 100.0
+        if desc_similarity is None:
+            # Normalize to lowercase for fuzz ratio
+            alert_desc = str(alert["description"]).lower().strip()
+            polled_desc = str(polled["description"]).lower().strip()
+            desc_similarity = fuzz.ratio(alert_desc, polled_desc) / 100.0
         score += desc_similarity * DESC_WEIGHT
 
     # --- Weight 3: Polling Time Window (15%) ---
@@ -165,9 +234,23 @@ def calculate_match_score(alert: Dict[str, Any], polled: Dict[str, Any]) -> floa
 
 # --- FASTAPI APPLICATION AND ENDPOINTS ---
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db_async()
+    await poller.sync_transactions_generation()
+    await account_shards.load(await get_recent_transactions())
+    transaction_poller = asyncio.create_task(poller.start_transaction_poller()) if settings.TRANSACTIONS_POLL_INTERVAL_SECONDS > 0 else None
+    yield
+    if transaction_poller is not None:
+        transaction_poller.cancel()
+        await asyncio.gather(transaction_poller, return_exceptions=True)
+    await close_inbox_reader()
+    account_shards.close()
+
 app = FastAPI(
     title="A2A Telex Verification Agent",
-    description="A simple, simulated AI agent for matching bank alert emails to a pre-polled transaction ledger."
+    description="A simple, simulated AI agent for matching bank alert emails to a pre-polled transaction ledger.",
+    lifespan=lifespan,
 )
 #
 @app.get("/.well-known/agent.json", response_model=Dict[str, Any], tags=["A2A Protocol"])
@@ -194,10 +277,39 @@ def get_agent_manifest():
         ]
     }
 
-@app.post("/process_alert", response_model=AgentArtifact, tags=["A2A Protocol"])
-def process_alert(request: AlertRequest):
+# Bounds concurrent work on the verification endpoints; excess load is shed with 429/503
+admission = AdmissionController(
+    settings.ADMISSION_MAX_CONCURRENCY,
+    settings.ADMISSION_MAX_QUEUE,
+    settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    settings.ADMISSION_RETRY_AFTER_SECONDS,
+)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.post(
+    "/process_alert",
+    response_model=AgentArtifact,
+    tags=["A2A Protocol"],
+    responses={429: {"description": "Admission queue full"}, 503: {"description": "Timed out waiting for admission"}},
+)
+async def process_alert(request: AlertRequest):
     """
     The main A2A Task endpoint. Receives the email content, runs the logic, and returns the Artifact.
+    Requests beyond the admission limit wait in a bounded queue ordered by `priority`.
+    """
+    async with admission.slot(request.priority):
+        return await run_in_threadpool(verify_alert, request)
+
+def verify_alert(request: AlertRequest) -> AgentArtifact:
+    """
+    Parses the alert, scores it against the ledger and marks the best match as verified.
     """
     email_content = request.email_content
     
@@ -207,22 +319,50 @@ def process_alert(request: AlertRequest):
     if alert_data["amount"] is None or alert_data["description"] is None:
         raise HTTPException(status_code=400, detail="Agent failed to reliably parse amount or description from the email.")
 
-    # 2. REASON: Find the best match in the ledger
+    # 2. REASON: Find the best match in the ledger (memoized per ledger generation)
     best_match: PolledTransaction | None = None
     highest_score: float = 0.0
-
-    for tx_id, polled_tx_dict in TRANSACTION_LEDGER.items():
-        polled_tx = PolledTransaction(**polled_tx_dict)
-        score = calculate_match_score(alert_data, polled_tx_dict)
-        
-        if score > highest_score:
-            highest_score = score
-            best_match = polled_tx
+    best_tx_id: str | None = None
+
+    generation, ledger, merchants = ledger_state()
+    cache_key = (
+        generation,
+        alert_data["amount"],
+        alert_data["description"],
+        alert_data["date"] or datetime.now().date().isoformat(),
+    )
+    cached = ledger_match_cache.get(cache_key)
+    if cached is not None and (cached[0] is None or cached[0] in ledger):
+        best_tx_id, highest_score = cached
+    else:
+        # fuzzy-compare only the distinct descriptions the merchant index finds similar enough
+        # to reach the threshold; every other row scores 0 on description for now
+        similar = merchants.similarities(alert_data["description"], cutoff=DESC_SIMILARITY_CUTOFF)
+        approx = []
+        for tx_id, polled_tx_dict in list(ledger.items()):
+            desc_similarity = similar.get(normalize_description(polled_tx_dict.get("description")), 0.0) / 100.0
+            approx.append((calculate_match_score(alert_data, polled_tx_dict, desc_similarity), tx_id))
+
+        # only those rows can reach the threshold, but a FAIL still reports the highest exact
+        # score: rescore, best first, every row whose description could lift it past the best
+        approx.sort(reverse=True)
+        for score, tx_id in approx:
+            if score + DESC_CUTOFF_HEADROOM <= highest_score:
+                break
+            score = calculate_match_score(alert_data, ledger[tx_id])
+            if score > highest_score:
+                highest_score = score
+                best_tx_id = tx_id
+        ledger_match_cache.put(cache_key, (best_tx_id, highest_score))
+
+    if best_tx_id is not None:
+        best_match = PolledTransaction(**ledger[best_tx_id])
 
     # 3. ACT: Return the final artifact based on the threshold
     if highest_score >= ACCURACY_THRESHOLD and best_match:
         # Update ledger status (simulating a tool call to a database)
-        TRANSACTION_LEDGER[best_match.tx_id]["verified"] = True
+        ledger[best_match.tx_id]["verified"] = True
+        bump_ledger_generation()
         
         artifact = AgentArtifact(
             status="COMPLETED",
@@ -244,29 +384,93 @@ def process_alert(request: AlertRequest):
         
     return artifact
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
 @app.get("/ledger", response_model=List[PolledTransaction], tags=["Diagnostics"])
-def get_ledger():
+def get_ledger(
+    cursor: Optional[str] = Query(None, description="tx_id to resume after (from X-Next-Cursor)."),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    verified: Optional[bool] = None,
+    description: Optional[str] = Query(None, description="Case-insensitive substring of the description."),
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    if_none_match: Optional[str] = Header(None),
+):
     """
     Returns the current state of the in-memory transaction ledger for diagnostic purposes.
+    Entries are ordered by tx_id; the ETag changes only when the ledger does.
     """
-    return [PolledTransaction(**tx) for tx in TRANSACTION_LEDGER.values()]
+    generation, entries = ledger_snapshot()
+    etag = f'"ledger-{generation}"'
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    key = (generation, cursor, limit, verified, description, min_amount, max_amount)
+    cached = ledger_response_cache.get(key)
+    if cached is None:
+        needle = description.lower() if description else None
+        page: List[Dict[str, Any]] = []
+        next_cursor = None
+        for tx in entries:
+            if cursor is not None and tx["tx_id"] <= cursor:
+                continue
+            if verified is not None and tx["verified"] != verified:
+                continue
+            if needle and needle not in tx["description"].lower():
+                continue
+            if min_amount is not None and tx["amount"] < min_amount:
+                continue
+            if max_amount is not None and tx["amount"] > max_amount:
+                continue
+            if limit is not None and len(page) == limit:
+                next_cursor = page[-1]["tx_id"]
+                break
+            page.append(tx)
+        cached = (orjson.dumps(page), next_cursor)
+        with _LEDGER_LOCK:
+            if generation == LEDGER_GENERATION:
+                ledger_response_cache.put(key, cached)
+
+    body, next_cursor = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.post("/ledger/re-poll", tags=["Diagnostics"])
-def re_poll_ledger():
+def re_poll_ledger(count: int = Query(5, ge=1, le=100_000)):
     """
     Forces a refresh of the mock transaction ledger.
     """
-    generate_mock_ledger()
+    generate_mock_ledger(count)
     return {"message": "Transaction ledger re-polled successfully with new mock data."}
 
-async def ingest_email_payload(raw_email: dict, parsed: dict):
+async def ingest_email_payload(raw_email: dict, parsed: dict, mail_cursor: Optional[Tuple[str, int]] = None):
     """
     Called by email_reader after fetching and parsing an email.
     Stores the email, runs matching, and optionally sends notifications.
+    A `mail_cursor` (source, message id) is claimed together with the stored email, and
+    AlreadyIngested is raised, with nothing stored, if another poll got there first.
     """
-    sess = get_session()
     email_id = f"eml-{uuid.uuid4().hex[:8]}"
 
+    # fall back to the LLM for fields the regex parser missed
+    if settings.GEMINI_FALLBACK_ENABLED and settings.GEMINI_API_KEY and (parsed.get("amount") is None or not parsed.get("reference")):
+        extracted = await extract_alert_fields(f"{raw_email.get('subject') or ''}\n{raw_email.get('body') or ''}")
+        if extracted:
+            parsed = dict(parsed)
+            for key in ("amount", "merchant", "reference"):
+                if parsed.get(key) in (None, "") and extracted.get(key) not in (None, ""):
+                    parsed[key] = extracted[key]
+            try:
+                parsed["amount"] = float(parsed["amount"]) if parsed.get("amount") is not None else None
+            except (TypeError, ValueError):
+                parsed["amount"] = None
+
     # store parsed + raw email
     alert = EmailAlert(
         id=email_id,
@@ -280,44 +484,133 @@ async def ingest_email_payload(raw_email: dict, parsed: dict):
         parsed_reference=parsed.get("reference"),
         parsed_merchant=parsed.get("merchant"),
     )
-    sess.add(alert)
-    sess.commit()
+    async with async_session_scope() as sess:
+        sess.add(alert)
+        if mail_cursor is not None:
+            await claim_message(sess, *mail_cursor)
 
-    # get recent transactions (last 24h)
-    candidates = get_recent_transactions()
-
-    # run matching
-    match_result = choose_best({
+    match_parsed = {
         "amount": parsed.get("amount"),
         "merchant": parsed.get("merchant"),
         "reference": parsed.get("reference"),
         "received_at": datetime.utcnow(),
-    }, candidates)
+    }
+
+    # score against recent transactions (last 24h) of the alert's account, or all of them
+    # when the alert carries no real mask; the time-independent part of each score is
+    # memoized until the transaction table changes (in this process or any other), which
+    # also makes the shards reload the window from the DB
+    cutoff = recent_cutoff()
+    cache_key = (
+        await poller.sync_transactions_generation(),
+        alert_account_key(parsed.get("account_masked")),
+        match_parsed["amount"],
+        normalize_merchant(match_parsed["merchant"]),
+        match_parsed["reference"],
+    )
+    statics = ingest_match_cache.get(cache_key)
+    if statics is None:
+        await account_shards.ensure_loaded(get_recent_transactions)
+        statics = await account_shards.score(match_parsed, parsed.get("account_masked"), cutoff)
+        ingest_match_cache.put(cache_key, statics)
+    else:
+        statics = [(tx, static) for tx, static in statics if tx["timestamp"] >= cutoff]
+
+    # run matching
+    match_result = rank(match_parsed, statics)
 
     # record match run
     run = MatchRun(
         id=f"run-{uuid.uuid4().hex[:8]}",
         email_id=email_id,
         chosen_tx_id=(match_result["best"]["tx"]["id"] if match_result["best"] else None),
-        candidates=json.dumps(match_result["candidates"]),
+        candidates=json.dumps(match_result["candidates"], default=str),
         score=(match_result["best"]["score"] if match_result["best"] else None),
         status=match_result["status"],
         created_at=datetime.utcnow(),
         note="Automatic IMAP ingest",
     )
-    sess.add(run)
-    sess.commit()
-    sess.close()
+    async with async_session_scope() as sess:
+        sess.add(run)
 
     print(f"[EMAIL INGESTED] {email_id} → {match_result['status']} ({match_result['best']['score'] if match_result['best'] else 'N/A'}%)")
 
+    # notify the Telex channel
+    best_score = match_result["best"]["score"] if match_result["best"] else None
+    try:
+        await send_telex_message(
+            settings.TELEX_CHANNEL_ID,
+            f"Bank alert {match_result['status']}",
+            f"{raw_email.get('subject') or ''} → {run.chosen_tx_id or 'no transaction'} ({best_score if best_score is not None else 'N/A'})",
+            {
+                "email_id": email_id,
+                "status": match_result["status"],
+                "score": best_score,
+                "chosen_tx_id": run.chosen_tx_id,
+                "reference": parsed.get("reference"),
+            },
+        )
+    except Exception as e:
+        print(f"[TELEX] Failed to notify for {email_id}: {e}")
+
+@app.get("/admin/admission", tags=["Diagnostics"])
+def get_admission_stats():
+    """
+    Returns admission-control counters: active requests, queue depth and shed counts.
+    """
+    return admission.stats()
+
+@app.get("/admin/match_cache", tags=["Diagnostics"])
+def get_match_cache_stats():
+    """
+    Returns hit/miss counters and memory use of the match-result and /ledger response caches.
+    """
+    return {
+        "ledger": {"generation": LEDGER_GENERATION, **ledger_match_cache.stats()},
+        "ingest": {"generation": poller.TRANSACTIONS_GENERATION, **ingest_match_cache.stats()},
+        "ledger_responses": {"generation": LEDGER_GENERATION, **ledger_response_cache.stats()},
+    }
+
+@app.get("/admin/merchants", tags=["Diagnostics"])
+def search_merchants(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    cutoff: float = Query(60.0, ge=0, le=100),
+):
+    """
+    Returns the indexed ledger descriptions most similar to `q`.
+    """
+    _, _, merchants = ledger_state()
+    return {"ledger": [{"name": n, "score": s} for n, s in merchants.search(q, limit, cutoff)]}
+
+@app.get("/admin/match_runs", tags=["Diagnostics"])
+async def list_match_runs(limit: int = 50, sess: AsyncSession = Depends(get_async_session)):
+    """
+    Returns the most recent match runs recorded by the ingestion path.
+    """
+    stmt = select(MatchRun).order_by(MatchRun.created_at.desc()).limit(min(max(limit, 1), 500))
+    rows = (await sess.exec(stmt)).all()
+    return [r.model_dump() for r in rows]
+
 @app.get("/mailtrap/fetch", tags=["Mailtrap"])
-def fetch_mailtrap_alerts():
+async def fetch_mailtrap_alerts():
     """
-    Fetches messages directly from Mailtrap API and processes them.
+    Fetches new messages from the Mailtrap inbox API and ingests them, oldest first.
     """
-    messages = fetch_mailtrap_messages()
-    print(f"[MAILTRAP] Retrieved {len(messages)} messages.")
+    if not settings.MAILTRAP_ACCOUNT_ID or not settings.MAILTRAP_INBOX_ID:
+        print("Mailtrap not configured; skipping mail fetch")
+        return {"message_count": 0, "messages": []}
+
+    reader = get_inbox_reader()
+
+    async def ingest(message: dict):
+        await ingest_email_payload(message, parse_email(message), (reader.cursor_source, message["id"]))
+
+    try:
+        messages = await reader.poll(ingest)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Mailtrap API request failed: {e}")
+    print(f"[MAILTRAP] Ingested {len(messages)} messages.")
     return {"message_count": len(messages), "messages": messages}
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from .config import settings
+
+
+def approx_size(obj: Any, _depth: int = 0) -> int:
+    """Rough deep size in bytes of the dict/list/tuple/str/number values stored in the cache."""
+    size = sys.getsizeof(obj)
+    if _depth > 4:
+        return size
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(approx_size(v, _depth + 1) for v in obj)
+    return size
+
+
+class MatchCache:
+    """
+    Thread-safe LRU memo with a per-entry TTL and an approximate memory budget.
+
+    Callers put a generation counter in the key, so results computed against an
+    older ledger or transaction set can never be returned; clear() is called on
+    every generation bump to release them early.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        size = approx_size(key) + approx_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def normalize_merchant(value: Optional[str]) -> Optional[str]:
+    # token_set_ratio splits on whitespace but is case-sensitive, so only collapse spacing
+    return " ".join(value.split()) if value else None
+
+
+# /process_alert results against the in-memory ledger, keyed by ledger generation
+ledger_match_cache = MatchCache(settings.MATCH_CACHE_MAX_BYTES, settings.MATCH_CACHE_TTL_SECONDS)
+# ingestion scoring against the stored transactions, keyed by transactions generation
+ingest_match_cache = MatchCache(settings.MATCH_CACHE_MAX_BYTES, settings.MATCH_CACHE_TTL_SECONDS)
+# serialized GET /ledger pages, keyed by ledger generation and query parameters
+ledger_response_cache = MatchCache(settings.LEDGER_RESPONSE_CACHE_MAX_BYTES, settings.MATCH_CACHE_TTL_SECONDS)
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from rapidfuzz import fuzz
 from datetime import datetime
 import json
@@ -34,11 +34,13 @@ def merchant_score(parsed_merchant: Optional[str], tx_merchant: Optional[str]) -
         return 0.0
     return float(fuzz.token_set_ratio(parsed_merchant, tx_merchant))
 
-def combined_score(parsed: Dict[str,Any], tx: Dict[str,Any]) -> float:
-    w_ref = 0.5
-    w_amount = 0.3
-    w_date = 0.1
-    w_merchant = 0.1
+W_REF = 0.5
+W_AMOUNT = 0.3
+W_DATE = 0.1
+W_MERCHANT = 0.1
+
+def static_score(parsed: Dict[str,Any], tx: Dict[str,Any]) -> Tuple[float, float, float]:
+    """Weighted reference, amount and merchant components; they do not depend on the alert time."""
     score_ref = 0.0
     if parsed.get("reference") and tx.get("metadata"):
         try:
@@ -50,22 +52,20 @@ def combined_score(parsed: Dict[str,Any], tx: Dict[str,Any]) -> float:
             score_ref = 0.0
 
     score_amount = amount_score(parsed.get("amount"), tx.get("amount"))
-    score_date = date_score(parsed.get("received_at"), tx.get("timestamp"))
     score_merchant = merchant_score(parsed.get("merchant"), tx.get("merchant"))
+    return (score_ref * W_REF, score_amount * W_AMOUNT, score_merchant * W_MERCHANT)
 
-    combined = (
-        (score_ref * w_ref) +
-        (score_amount * w_amount) +
-        (score_date * w_date) +
-        (score_merchant * w_merchant)
-    )
-    return float(combined)
+def with_date(parsed: Dict[str,Any], tx: Dict[str,Any], static: Tuple[float, float, float]) -> float:
+    ref, amount, merchant = static
+    score_date = date_score(parsed.get("received_at"), tx.get("timestamp"))
+    return float(ref + amount + (score_date * W_DATE) + merchant)
 
-def choose_best(parsed: Dict[str,Any], candidates: List[Dict[str,Any]]) -> Dict[str,Any]:
-    scored = []
-    for tx in candidates:
-        sc = combined_score(parsed, tx)
-        scored.append({"tx": tx, "score": sc})
+def combined_score(parsed: Dict[str,Any], tx: Dict[str,Any]) -> float:
+    return with_date(parsed, tx, static_score(parsed, tx))
+
+def rank(parsed: Dict[str,Any], statics: List[Tuple[Dict[str,Any], Tuple[float, float, float]]]) -> Dict[str,Any]:
+    """choose_best over precomputed static_score components (see match_cache)."""
+    scored = [{"tx": tx, "score": with_date(parsed, tx, static)} for tx, static in statics]
     scored.sort(key=lambda x: x["score"], reverse=True)
     if not scored:
         return {"status":"no_match", "best": None, "candidates": []}
@@ -75,4 +75,7 @@ def choose_best(parsed: Dict[str,Any], candidates: List[Dict[str,Any]]) -> Dict[
     elif best["score"] >= LOW_SCORE:
         return {"status":"ambiguous", "best": best, "candidates": scored}
     else:
-        return {"status":"no_match", "best": best, "candidates": scored}
\ No newline at end of file
+        return {"status":"no_match", "best": best, "candidates": scored}
+
+def choose_best(parsed: Dict[str,Any], candidates: List[Dict[str,Any]]) -> Dict[str,Any]:
+    return rank(parsed, [(tx, static_score(parsed, tx)) for tx in candidates])
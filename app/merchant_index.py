@@ -0,0 +1,108 @@
+import math
+import threading
+from array import array
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from rapidfuzz import fuzz, process
+
+
+def normalize_description(value: Optional[str]) -> str:
+    return " ".join(str(value).lower().split()) if value else ""
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MerchantIndex:
+    """
+    Character-trigram inverted index over distinct merchant/description strings.
+
+    search() returns the top-N strings whose scorer similarity (fuzz.ratio by default)
+    is at least `cutoff`. Small indexes are scanned exhaustively, which is exact. Past
+    `exhaustive_limit` entries, only entries sharing at least `min_overlap` of the
+    query's trigrams are considered: they must appear in one of the rarest posting
+    lists, and the `max_candidates` appearing in most of them are rescored. This is
+    approximate, so a string sharing few trigrams with the query (typically a very
+    short one) can be missed even if its ratio clears the cutoff. Strings can be
+    added at any time and are searchable immediately; there is no removal, only clear().
+    """
+
+    def __init__(
+        self,
+        scorer: Callable[..., float] = fuzz.ratio,
+        min_overlap: float = 0.5,
+        max_candidates: int = 500,
+        exhaustive_limit: int = 5000,
+    ):
+        self.scorer = scorer
+        self.min_overlap = min_overlap
+        self.max_candidates = max_candidates
+        self.exhaustive_limit = exhaustive_limit
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._postings: Dict[str, array] = defaultdict(lambda: array("I"))
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, value: str) -> bool:
+        return normalize_description(value) in self._ids
+
+    def add(self, value: Optional[str]) -> Optional[int]:
+        name = normalize_description(value)
+        if not name:
+            return None
+        with self._lock:
+            doc = self._ids.get(name)
+            if doc is not None:
+                return doc
+            doc = len(self._names)
+            self._ids[name] = doc
+            self._names.append(name)
+            for gram in trigrams(name):
+                self._postings[gram].append(doc)
+            return doc
+
+    def add_many(self, values: Iterable[Optional[str]]):
+        with self._lock:
+            for value in values:
+                self.add(value)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+            self._postings.clear()
+
+    def _candidates(self, query: str) -> List[int]:
+        grams = trigrams(query)
+        lists = sorted((self._postings[g] for g in grams if g in self._postings), key=len)
+        need = max(1, math.ceil(len(grams) * self.min_overlap))
+        if need > len(lists):
+            return []
+        # an entry sharing `need` grams is in at least one of the len - need + 1 rarest
+        # lists; the more of them it is in, the likelier it is to clear the cutoff
+        counts = Counter()
+        counts.update(chain.from_iterable(lists[:len(lists) - need + 1]))
+        return [doc for doc, _ in counts.most_common(self.max_candidates)]
+
+    def search(self, query: Optional[str], limit: Optional[int] = 10, cutoff: float = 50.0) -> List[Tuple[str, float]]:
+        """[(normalized name, score)] best first, at most `limit` (None for all) above `cutoff`."""
+        q = normalize_description(query)
+        if not q:
+            return []
+        with self._lock:
+            if len(self._names) <= self.exhaustive_limit:
+                choices = self._names
+            else:
+                choices = [self._names[doc] for doc in self._candidates(q)]
+            matches = process.extract(q, choices, scorer=self.scorer, score_cutoff=cutoff, limit=limit)
+        return [(name, float(score)) for name, score, _ in matches]
+
+    def similarities(self, query: Optional[str], cutoff: float = 50.0) -> Dict[str, float]:
+        """Every indexed name scoring at least `cutoff`, as {normalized name: score}."""
+        return dict(self.search(query, limit=None, cutoff=cutoff))
+
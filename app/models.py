@@ -1,10 +1,11 @@
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 from typing import Optional
 from datetime import datetime
 
 class Transaction(SQLModel, table=True):
     id: str = Field(primary_key=True)
-    timestamp: datetime
+    timestamp: datetime = Field(index=True)
     account_masked: Optional[str] = None
     merchant: Optional[str] = None
     amount: float
@@ -12,7 +13,15 @@ class Transaction(SQLModel, table=True):
     extra_data: Optional[str] = None
     is_simulated: bool = True
 
+class TableVersion(SQLModel, table=True):
+    # bumped by writers in the same transaction as their inserts (see poller.store_transactions)
+    name: str = Field(primary_key=True)
+    version: int = 0
+
 class EmailAlert(SQLModel, table=True):
+    # keyset pagination in app.rematch walks (received_at, id)
+    __table_args__ = (Index("ix_emailalert_received_at_id", "received_at", "id"),)
+
     id: str = Field(primary_key=True)
     received_at: datetime
     raw_subject: str
@@ -26,10 +35,14 @@ class EmailAlert(SQLModel, table=True):
 
 class MatchRun(SQLModel, table=True):
     id: str = Field(primary_key=True)
-    email_id: str
+    email_id: str = Field(index=True)
     chosen_tx_id: Optional[str] = None
     candidates: Optional[str] = None
     score: Optional[float] = None
     status: str = "no_match"
     created_at: datetime
-    note: Optional[str] = None
\ No newline at end of file
+    note: Optional[str] = None
+class MailCursor(SQLModel, table=True):
+    # newest message id ingested from a mail source; moved in the same transaction as the alert
+    source: str = Field(primary_key=True)
+    last_seen_id: int = 0
@@ -1,51 +1,154 @@
-import os, json
-from datetime import datetime, timedelta
-from typing import List, Dict,Any
-from .db import get_session
-from .models import Transaction
+import os, json, asyncio
+import httpx
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Tuple
+from .config import settings
+from .db import async_session_scope
+from .match_cache import ingest_match_cache
+from .shards import account_shards
+from .models import TableVersion, Transaction
+from sqlalchemy import func, update
 from sqlmodel import select
 
 SAMPLE_FILE = os.path.join(os.path.dirname(__file__), "sample_data", "sample_transactions.json")
 
+# Bumped whenever new transactions are stored; keys the ingestion match cache
+TRANSACTIONS_GENERATION = 0
+# (newest timestamp, writer version) of the transaction table when the generation last moved
+_TRANSACTIONS_WATERMARK: Optional[Tuple[Optional[datetime], int]] = None
+
+def bump_transactions_generation() -> int:
+    global TRANSACTIONS_GENERATION
+    TRANSACTIONS_GENERATION += 1
+    ingest_match_cache.clear()
+    return TRANSACTIONS_GENERATION
+
+async def _read_watermark() -> Tuple[Optional[datetime], int]:
+    """
+    Two index lookups, independent of the table size: max(timestamp) on its index catches
+    rows inserted directly (backfills, fixtures), and the version row catches everything
+    written through store_transactions, whatever the timestamps.
+    """
+    async with async_session_scope() as sess:
+        newest = (await sess.exec(select(func.max(Transaction.timestamp)))).one()
+        row = await sess.get(TableVersion, "transaction")
+        return newest, (row.version if row else 0)
+
+async def _bump_table_version(sess, name: str):
+    result = await sess.exec(update(TableVersion).where(TableVersion.name == name).values(version=TableVersion.version + 1))
+    if result.rowcount == 0:
+        sess.add(TableVersion(name=name, version=1))
+
+async def sync_transactions_generation() -> int:
+    """
+    Bumps the generation when the transaction table changed since the last check, which
+    also catches rows written by other processes (another worker, a backfill script);
+    the account shards are then reloaded from the DB on next use. Returns the current
+    generation.
+    """
+    global _TRANSACTIONS_WATERMARK
+    watermark = await _read_watermark()
+    if watermark != _TRANSACTIONS_WATERMARK:
+        _TRANSACTIONS_WATERMARK = watermark
+        account_shards.invalidate()
+        bump_transactions_generation()
+    return TRANSACTIONS_GENERATION
+
+def recent_cutoff(window_hours=24) -> datetime:
+    return datetime.utcnow() - timedelta(hours=window_hours)
+
 def load_sample_transactions() -> List[Dict[str,Any]]:
     with open(SAMPLE_FILE, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def refresh_transactions_from_sample():
-    data = load_sample_transactions()
-    sess = get_session()
-    for tx in data:
-        obj = Transaction(
-            id=tx["id"],
-            timestamp=datetime.fromisoformat(tx["timestamp"]),
-            account_masked=tx.get("account_masked"),
-            merchant=tx.get("merchant"),
-            amount=float(tx["amount"]),
-            currency=tx.get("currency","NGN"),
-            metadata=json.dumps(tx.get("metadata", {})),
-            is_simulated=tx.get("is_simulated", True)
-        )
-        existing = sess.get(Transaction, obj.id)
-        if not existing:
+def transaction_to_dict(r: Transaction) -> Dict[str,Any]:
+    return {
+        "id": r.id,
+        "timestamp": r.timestamp,
+        "account_masked": r.account_masked,
+        "merchant": r.merchant,
+        "amount": r.amount,
+        "currency": r.currency,
+        "metadata": r.extra_data
+    }
+
+async def fetch_api_transactions() -> List[Dict[str,Any]]:
+    headers = {}
+    if settings.TRANSACTIONS_API_TOKEN:
+        headers["Authorization"] = f"Bearer {settings.TRANSACTIONS_API_TOKEN}"
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        r = await client.get(settings.TRANSACTIONS_API_URL, headers=headers)
+        r.raise_for_status()
+        return r.json()
+
+def _utc_naive(value: str) -> datetime:
+    ts = datetime.fromisoformat(value)
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+async def _absorb_own_writes():
+    """
+    Moves the watermark past the rows this process just stored (and added to the shards), so
+    they do not force a reload. If another writer bumped the version in the meantime, it still does.
+    """
+    global _TRANSACTIONS_WATERMARK
+    before = _TRANSACTIONS_WATERMARK
+    watermark = await _read_watermark()
+    if before is None or watermark[1] != before[1] + 1:
+        account_shards.invalidate()
+    _TRANSACTIONS_WATERMARK = watermark
+
+async def store_transactions(data: List[Dict[str,Any]]):
+    added = []
+    async with async_session_scope() as sess:
+        ids = [tx["id"] for tx in data]
+        existing = set((await sess.exec(select(Transaction.id).where(Transaction.id.in_(ids)))).all()) if ids else set()
+        for tx in data:
+            if tx["id"] in existing:
+                continue
+            obj = Transaction(
+                id=tx["id"],
+                timestamp=_utc_naive(tx["timestamp"]),
+                account_masked=tx.get("account_masked"),
+                merchant=tx.get("merchant"),
+                amount=float(tx["amount"]),
+                currency=tx.get("currency","NGN"),
+                extra_data=json.dumps(tx.get("metadata", {})),
+                is_simulated=tx.get("is_simulated", True)
+            )
             sess.add(obj)
-    sess.commit()
-    sess.close()
+            existing.add(obj.id)
+            added.append(transaction_to_dict(obj))
+        if added:
+            await _bump_table_version(sess, "transaction")
+    if added:
+        await account_shards.add(added)
+        await _absorb_own_writes()
+        bump_transactions_generation()
+
+async def refresh_transactions_from_sample():
+    await store_transactions(load_sample_transactions())
 
-def get_recent_transactions(window_hours=24) -> List[Dict[str,Any]]:
-    sess = get_session()
-    cutoff = datetime.utcnow() - timedelta(hours=window_hours)
+async def refresh_transactions_from_api():
+    await store_transactions(await fetch_api_transactions())
+
+async def refresh_transactions():
+    if settings.TRANSACTIONS_SOURCE == "api" and settings.TRANSACTIONS_API_URL:
+        await refresh_transactions_from_api()
+    else:
+        await refresh_transactions_from_sample()
+
+async def get_recent_transactions(window_hours=24) -> List[Dict[str,Any]]:
+    cutoff = recent_cutoff(window_hours)
     stmt = select(Transaction).where(Transaction.timestamp >= cutoff)
-    rows = sess.exec(stmt).all()
-    result = []
-    for r in rows:
-        result.append({
-            "id": r.id,
-            "timestamp": r.timestamp,
-            "account_masked": r.account_masked,
-            "merchant": r.merchant,
-            "amount": r.amount,
-            "currency": r.currency,
-            "metadata": r.metadata
-        })
-    sess.close()
-    return result
\ No newline at end of file
+    async with async_session_scope() as sess:
+        rows = (await sess.exec(stmt)).all()
+        return [transaction_to_dict(r) for r in rows]
+
+async def start_transaction_poller():
+    interval = settings.TRANSACTIONS_POLL_INTERVAL_SECONDS
+    while True:
+        try:
+            await refresh_transactions()
+        except Exception as e:
+            print("Transaction poll error:", e)
+        await asyncio.sleep(interval)
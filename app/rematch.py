@@ -0,0 +1,295 @@
+"""
+Re-run matching over historical alerts, e.g. after tuning matcher weights or
+HIGH_SCORE/LOW_SCORE.
+
+EmailAlert rows are streamed in keyset-paginated chunks ordered by
+(received_at, id). Each chunk is shipped to a process pool with the
+transactions inside its alerts' windows, not the chunk's whole time span, so
+sparse alerts months apart do not pull in the months between them. Workers
+re-parse the raw email and re-score it against the transactions of its own
+window, narrowed to the alert's account as live ingestion does. Results are
+bulk-written as new MatchRun rows (--write) and/or appended to a JSONL diff
+report against each alert's latest previous run (--report). A checkpoint is
+saved after every chunk so an interrupted job resumes where it stopped; alerts
+that already got a run from the interrupted job (written just before a crash)
+are not written or reported twice.
+
+    python -m app.rematch --report rematch.jsonl --workers 8
+    python -m app.rematch --write --since 2025-11-01 --checkpoint rematch.ckpt
+"""
+import argparse
+import bisect
+import json
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import and_, insert, or_
+from sqlmodel import Session, select
+from . import matcher
+from .email_parser import parse_email
+from .models import EmailAlert, MatchRun, Transaction
+from .poller import transaction_to_dict
+from .shards import account_candidates, alert_account_key
+
+REMATCH_NOTE = "rematch"
+
+
+def load_checkpoint(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """{"after": (received_at, id), "started_at": job start} of an interrupted job, if any."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        "after": (datetime.fromisoformat(data["received_at"]), data["id"]),
+        "started_at": datetime.fromisoformat(data["started_at"]) if data.get("started_at") else None,
+    }
+
+def save_checkpoint(path: Optional[str], key: Tuple[datetime, str], processed: int, started_at: datetime):
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"received_at": key[0].isoformat(), "id": key[1], "processed": processed,
+                   "started_at": started_at.isoformat()}, f)
+    os.replace(tmp, path)
+
+def iter_alert_chunks(
+    sess: Session,
+    chunk_size: int,
+    after: Optional[Tuple[datetime, str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Iterator[List[EmailAlert]]:
+    """Yields EmailAlert rows in (received_at, id) order without OFFSET scans."""
+    while True:
+        stmt = select(EmailAlert)
+        if after is not None:
+            stmt = stmt.where(or_(
+                EmailAlert.received_at > after[0],
+                and_(EmailAlert.received_at == after[0], EmailAlert.id > after[1]),
+            ))
+        if since is not None:
+            stmt = stmt.where(EmailAlert.received_at >= since)
+        if until is not None:
+            stmt = stmt.where(EmailAlert.received_at < until)
+        rows = sess.exec(stmt.order_by(EmailAlert.received_at, EmailAlert.id).limit(chunk_size)).all()
+        if not rows:
+            return
+        yield rows
+        after = (rows[-1].received_at, rows[-1].id)
+
+def alert_windows(received: List[datetime], window: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Union of the alerts' [received_at - window, received_at] ranges (sorted input) as disjoint intervals."""
+    intervals: List[Tuple[datetime, datetime]] = []
+    for at in received:
+        if intervals and at - window <= intervals[-1][1]:
+            intervals[-1] = (intervals[-1][0], at)
+        else:
+            intervals.append((at - window, at))
+    return intervals
+
+def load_window_transactions(sess: Session, intervals: List[Tuple[datetime, datetime]]) -> List[Dict[str, Any]]:
+    """Transactions inside any of the intervals, one indexed range query per interval."""
+    out = []
+    for start, end in intervals:
+        stmt = select(Transaction).where(Transaction.timestamp >= start, Transaction.timestamp <= end)
+        out.extend(transaction_to_dict(r) for r in sess.exec(stmt).all())
+    return out
+
+def latest_runs(sess: Session, email_ids: List[str], before: datetime) -> Dict[str, MatchRun]:
+    """Each alert's latest run created before the job started."""
+    stmt = (select(MatchRun)
+            .where(MatchRun.email_id.in_(email_ids), MatchRun.created_at < before)
+            .order_by(MatchRun.created_at))
+    return {run.email_id: run for run in sess.exec(stmt).all()}
+
+def already_rematched(sess: Session, email_ids: List[str], since: datetime) -> set:
+    """Alerts that already got a run from this job, e.g. written just before a crash."""
+    stmt = select(MatchRun.email_id).where(
+        MatchRun.email_id.in_(email_ids), MatchRun.note == REMATCH_NOTE, MatchRun.created_at >= since)
+    return set(sess.exec(stmt).all())
+
+def _init_worker(high_score: Optional[float], low_score: Optional[float]):
+    if high_score is not None:
+        matcher.HIGH_SCORE = high_score
+    if low_score is not None:
+        matcher.LOW_SCORE = low_score
+
+def rescore_chunk(alerts: List[Dict[str, Any]], transactions: List[Dict[str, Any]], window_hours: float) -> List[Dict[str, Any]]:
+    """Re-parses and re-scores one chunk; runs inside a pool worker."""
+    window = timedelta(hours=window_hours)
+    by_time = sorted(transactions, key=lambda tx: tx["timestamp"])
+    stamps = [tx["timestamp"] for tx in by_time]
+    out = []
+    for alert in alerts:
+        received_at = alert["received_at"]
+        parsed = parse_email({"subject": alert["raw_subject"], "body": alert["raw_body"]})
+        lo = bisect.bisect_left(stamps, received_at - window)
+        hi = bisect.bisect_right(stamps, received_at)
+        # same account partitioning as live ingestion (AccountShards)
+        candidates = account_candidates(by_time[lo:hi], alert_account_key(parsed.get("account_masked")))
+        result = matcher.choose_best({
+            "amount": parsed.get("amount"),
+            "merchant": parsed.get("merchant"),
+            "reference": parsed.get("reference"),
+            "received_at": received_at,
+        }, candidates)
+        best = result["best"]
+        out.append({
+            "email_id": alert["id"],
+            "status": result["status"],
+            "chosen_tx_id": best["tx"]["id"] if best else None,
+            "score": best["score"] if best else None,
+            "candidates": [{"tx_id": c["tx"]["id"], "score": c["score"]} for c in result["candidates"]],
+        })
+    return out
+
+def _alert_payload(alert: EmailAlert) -> Dict[str, Any]:
+    return {"id": alert.id, "received_at": alert.received_at, "raw_subject": alert.raw_subject, "raw_body": alert.raw_body}
+
+def run_rematch(
+    engine,
+    chunk_size: int = 500,
+    workers: int = 0,
+    window_hours: float = 24.0,
+    write: bool = False,
+    report_path: Optional[str] = None,
+    checkpoint_path: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    high_score: Optional[float] = None,
+    low_score: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Runs the job and returns counters; workers <= 1 scores in-process."""
+    workers = workers or os.cpu_count() or 1
+    checkpoint = load_checkpoint(checkpoint_path)
+    after = checkpoint["after"] if checkpoint else None
+    job_started = (checkpoint and checkpoint["started_at"]) or datetime.utcnow()
+    window = timedelta(hours=window_hours)
+    stats = {"processed": 0, "changed": 0, "written": 0, "skipped": 0, "statuses": {}}
+    report = open(report_path, "a" if after else "w", encoding="utf-8") if report_path else None
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(high_score, low_score)) if workers > 1 else None
+    if pool is None:
+        saved = (matcher.HIGH_SCORE, matcher.LOW_SCORE)
+        _init_worker(high_score, low_score)
+    pending: deque = deque()
+    started = time.perf_counter()
+
+    def finish(chunk_key: Tuple[datetime, str], email_ids: List[str], results: List[Dict[str, Any]]):
+        with Session(engine, expire_on_commit=False) as sess:
+            done = already_rematched(sess, email_ids, job_started) if write else set()
+            if done:
+                stats["skipped"] += len(done)
+                results = [r for r in results if r["email_id"] not in done]
+            previous = latest_runs(sess, email_ids, job_started) if report else {}
+            now = datetime.utcnow()
+            if write and results:
+                sess.execute(insert(MatchRun.__table__), [{
+                    "id": f"run-{uuid.uuid4().hex}",
+                    "email_id": r["email_id"],
+                    "chosen_tx_id": r["chosen_tx_id"],
+                    "candidates": json.dumps(r["candidates"]),
+                    "score": r["score"],
+                    "status": r["status"],
+                    "created_at": now,
+                    "note": REMATCH_NOTE,
+                } for r in results])
+                sess.commit()
+                stats["written"] += len(results)
+        for r in results:
+            stats["statuses"][r["status"]] = stats["statuses"].get(r["status"], 0) + 1
+            if report:
+                prev = previous.get(r["email_id"])
+                changed = prev is None or (prev.status, prev.chosen_tx_id) != (r["status"], r["chosen_tx_id"])
+                stats["changed"] += int(changed)
+                report.write(json.dumps({
+                    "email_id": r["email_id"],
+                    "changed": changed,
+                    "old": {"status": prev.status, "chosen_tx_id": prev.chosen_tx_id, "score": prev.score} if prev else None,
+                    "new": {"status": r["status"], "chosen_tx_id": r["chosen_tx_id"], "score": r["score"]},
+                }) + "\n")
+        if report:
+            report.flush()
+        stats["processed"] += len(results) + len(done)
+        save_checkpoint(checkpoint_path, chunk_key, stats["processed"], job_started)
+
+    def drain(limit: int):
+        while len(pending) > limit:
+            chunk_key, email_ids, future = pending.popleft()
+            finish(chunk_key, email_ids, future.result())
+            rate = stats["processed"] / max(time.perf_counter() - started, 1e-9)
+            print(f"[REMATCH] {stats['processed']} alerts re-scored ({rate:.0f}/s), through {chunk_key[0].isoformat()}")
+
+    try:
+        with Session(engine) as sess:
+            for chunk in iter_alert_chunks(sess, chunk_size, after, since, until):
+                alerts = [_alert_payload(a) for a in chunk]
+                # sparse alerts (a chunk spanning months) only pull the transactions near each alert
+                transactions = load_window_transactions(sess, alert_windows([a.received_at for a in chunk], window))
+                chunk_key = (chunk[-1].received_at, chunk[-1].id)
+                email_ids = [a.id for a in chunk]
+                if pool is None:
+                    finish(chunk_key, email_ids, rescore_chunk(alerts, transactions, window_hours))
+                    continue
+                # results are applied in order so the checkpoint never skips an unfinished chunk
+                pending.append((chunk_key, email_ids, pool.submit(rescore_chunk, alerts, transactions, window_hours)))
+                drain(workers * 2)
+        drain(0)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        else:
+            matcher.HIGH_SCORE, matcher.LOW_SCORE = saved
+        if report:
+            report.close()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--write", action="store_true", help="insert a new MatchRun per alert (note='rematch')")
+    ap.add_argument("--report", help="append a JSONL diff against each alert's latest MatchRun")
+    ap.add_argument("--checkpoint", help="resume from / save progress to this file")
+    ap.add_argument("--reset", action="store_true", help="ignore an existing checkpoint")
+    ap.add_argument("--chunk-size", type=int, default=500)
+    ap.add_argument("--workers", type=int, default=0, help="process count (default: all cores; 1 = in-process)")
+    ap.add_argument("--window-hours", type=float, default=24.0)
+    ap.add_argument("--since", type=datetime.fromisoformat)
+    ap.add_argument("--until", type=datetime.fromisoformat)
+    ap.add_argument("--high-score", type=float, help=f"override matcher.HIGH_SCORE ({matcher.HIGH_SCORE})")
+    ap.add_argument("--low-score", type=float, help=f"override matcher.LOW_SCORE ({matcher.LOW_SCORE})")
+    args = ap.parse_args(argv)
+    if not args.write and not args.report:
+        ap.error("nothing to do: pass --write and/or --report")
+    if args.reset and args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    from .db import engine, init_db
+    init_db()
+    stats = run_rematch(
+        engine,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        window_hours=args.window_hours,
+        write=args.write,
+        report_path=args.report,
+        checkpoint_path=args.checkpoint,
+        since=args.since,
+        until=args.until,
+        high_score=args.high_score,
+        low_score=args.low_score,
+    )
+    rate = stats["processed"] / max(stats["seconds"], 1e-9)
+    print(f"[REMATCH] done: {stats['processed']} alerts in {stats['seconds']:.1f}s ({rate:.0f}/s), "
+          f"{stats['changed']} changed, {stats['written']} runs written, {stats['skipped']} already written, "
+          f"statuses={stats['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import asyncio
+import bisect
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from .config import settings
+from .matcher import static_score
+
+Statics = List[Tuple[Dict[str, Any], Tuple[float, float, float]]]
+
+# a masked account number as printed in alerts ('****1234', '*** 1234')
+ALERT_MASK_RE = re.compile(r"^\*{3,}\s*(\d{4})$")
+# how often every shard, not only the ones looked up, is pruned to the window
+PRUNE_EVERY = timedelta(minutes=5)
+
+
+def account_key(mask: Optional[str]) -> Optional[str]:
+    """Shard key for an account mask: its last four digits ('****1234', '***1234' and '1234' agree)."""
+    if not mask:
+        return None
+    digits = re.sub(r"\D", "", mask)
+    return digits[-4:] if digits else None
+
+def alert_account_key(mask: Optional[str]) -> Optional[str]:
+    """
+    Shard key for the account mask parsed from an alert, or None unless it is a real mask.
+    The parser also accepts any bare run of four digits, which in practice is usually a year
+    or an amount, and partitioning on that would hide the alert's transaction.
+    """
+    m = ALERT_MASK_RE.match(mask.strip()) if mask else None
+    return m.group(1) if m else None
+
+def account_candidates(transactions: List[Dict[str, Any]], key: Optional[str]) -> List[Dict[str, Any]]:
+    """Same selection as AccountShardIndex.candidates over a plain list (used by app.rematch)."""
+    if key:
+        own = [tx for tx in transactions if (account_key(tx.get("account_masked")) or "") == key]
+        if own:
+            return own
+    return transactions
+
+def shard_of(key: Optional[str], shard_count: int) -> int:
+    """Stable owner of a shard key across processes and restarts."""
+    return zlib.crc32((key or "").encode()) % shard_count
+
+
+class AccountShardIndex:
+    """
+    Recent transactions partitioned by account key, each shard kept in timestamp order.
+
+    Transactions without a usable mask live in the '' shard. Lookups drop entries older
+    than the cutoff from the shard they read, and every PRUNE_EVERY from all shards, so
+    accounts that go quiet do not keep their transactions around.
+    """
+
+    def __init__(self):
+        self._shards: Dict[str, List[Tuple[datetime, str, Dict[str, Any]]]] = {}
+        self._ids: Dict[str, str] = {}
+        self._pruned_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, transactions: Iterable[Dict[str, Any]]):
+        for tx in transactions:
+            if tx["id"] in self._ids:
+                continue
+            key = account_key(tx.get("account_masked")) or ""
+            self._ids[tx["id"]] = key
+            bisect.insort(self._shards.setdefault(key, []), (tx["timestamp"], tx["id"], tx))
+
+    def _prune(self, key: str, cutoff: datetime) -> List[Tuple[datetime, str, Dict[str, Any]]]:
+        shard = self._shards.get(key, [])
+        cut = bisect.bisect_left(shard, (cutoff,))
+        if cut:
+            for _, tx_id, _ in shard[:cut]:
+                self._ids.pop(tx_id, None)
+            del shard[:cut]
+        if not shard:
+            self._shards.pop(key, None)
+        return shard
+
+    def prune(self, cutoff: datetime):
+        for key in list(self._shards):
+            self._prune(key, cutoff)
+        self._pruned_at = cutoff
+
+    def clear(self):
+        self._shards.clear()
+        self._ids.clear()
+        self._pruned_at = None
+
+    def shard(self, key: str, cutoff: datetime) -> List[Dict[str, Any]]:
+        if self._pruned_at is None or cutoff - self._pruned_at >= PRUNE_EVERY:
+            self.prune(cutoff)
+        return [tx for _, _, tx in self._prune(key, cutoff)]
+
+    def window(self, cutoff: datetime) -> List[Dict[str, Any]]:
+        return [tx for key in list(self._shards) for tx in self.shard(key, cutoff)]
+
+    def candidates(self, key: Optional[str], cutoff: datetime) -> List[Dict[str, Any]]:
+        """The account's shard, or the whole window when no key was parsed or the shard is empty."""
+        if key:
+            shard = self.shard(key, cutoff)
+            if shard:
+                return shard
+        return self.window(cutoff)
+
+
+# --- shard worker processes ---
+
+_worker_index: Optional[AccountShardIndex] = None
+
+def _init_worker():
+    global _worker_index
+    _worker_index = AccountShardIndex()
+
+def _worker_clear():
+    _worker_index.clear()
+
+def _worker_add(transactions: List[Dict[str, Any]]) -> int:
+    _worker_index.add(transactions)
+    return len(_worker_index)
+
+def _worker_score_shard(parsed: Dict[str, Any], key: str, cutoff: datetime) -> Optional[Statics]:
+    shard = _worker_index.shard(key, cutoff)
+    return [(tx, static_score(parsed, tx)) for tx in shard] if shard else None
+
+def _worker_score_window(parsed: Dict[str, Any], cutoff: datetime) -> Statics:
+    return [(tx, static_score(parsed, tx)) for tx in _worker_index.window(cutoff)]
+
+
+class AccountShards:
+    """
+    Candidate source for ingestion matching, partitioned by account mask.
+
+    The shards cache the DB's 24h window: ensure_loaded() (re)reads it after invalidate(),
+    which the poller calls when transactions were written by another process. Only an
+    alert carrying a real mask (see alert_account_key) is narrowed to its account.
+
+    With workers == 0 the shards live in this process. Otherwise each shard is owned by
+    one of `workers` single-process executors (chosen by shard_of), which keeps that
+    shard's transactions and scores alerts for it, so per-alert work and memory follow
+    one account's activity. Alerts without a mask, or whose shard is empty, fan out to
+    every worker and are scored against the full window.
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = max(0, workers)
+        self.loaded = False
+        self._local = AccountShardIndex() if self.workers == 0 else None
+        self._executors: List[ProcessPoolExecutor] = []
+        self._version = 0
+        self._load_lock: Optional[asyncio.Lock] = None
+
+    def _ensure_executors(self):
+        if not self._executors:
+            self._executors = [ProcessPoolExecutor(1, initializer=_init_worker) for _ in range(self.workers)]
+
+    async def add(self, transactions: List[Dict[str, Any]]):
+        if self._local is not None:
+            self._local.add(transactions)
+            return
+        self._ensure_executors()
+        routed: Dict[int, List[Dict[str, Any]]] = {}
+        for tx in transactions:
+            routed.setdefault(shard_of(account_key(tx.get("account_masked")) or "", self.workers), []).append(tx)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[
+            loop.run_in_executor(self._executors[i], _worker_add, txs) for i, txs in routed.items()
+        ])
+
+    async def _clear(self):
+        if self._local is not None:
+            self._local.clear()
+            return
+        self._ensure_executors()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(ex, _worker_clear) for ex in self._executors])
+
+    async def load(self, transactions: List[Dict[str, Any]]):
+        """Replaces the shards' contents with `transactions` (the current window)."""
+        await self._clear()
+        await self.add(transactions)
+        self.loaded = True
+
+    def invalidate(self):
+        """Marks the shards stale; the next ensure_loaded() reloads them."""
+        self._version += 1
+        self.loaded = False
+
+    async def ensure_loaded(self, fetch: Callable[[], Awaitable[List[Dict[str, Any]]]]):
+        """Loads the window from `fetch` unless the shards are current."""
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            while not self.loaded:
+                version = self._version
+                await self.load(await fetch())
+                # invalidated while fetching: the rows just loaded may already be stale
+                self.loaded = self._version == version
+
+    async def score(self, parsed: Dict[str, Any], account_masked: Optional[str], cutoff: datetime) -> Statics:
+        """static_score components for the alert's candidates (see matcher.rank)."""
+        key = alert_account_key(account_masked)
+        if self._local is not None:
+            return [(tx, static_score(parsed, tx)) for tx in self._local.candidates(key, cutoff)]
+        self._ensure_executors()
+        loop = asyncio.get_running_loop()
+        if key:
+            owner = self._executors[shard_of(key, self.workers)]
+            statics = await loop.run_in_executor(owner, _worker_score_shard, parsed, key, cutoff)
+            if statics is not None:
+                return statics
+        parts = await asyncio.gather(*[
+            loop.run_in_executor(ex, _worker_score_window, parsed, cutoff) for ex in self._executors
+        ])
+        return [item for part in parts for item in part]
+
+    def close(self):
+        for ex in self._executors:
+            ex.shutdown(cancel_futures=True)
+        self._executors = []
+
+
+account_shards = AccountShards(settings.MATCH_SHARD_WORKERS)
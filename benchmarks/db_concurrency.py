@@ -0,0 +1,156 @@
+"""
+Mixed read/write throughput benchmark for the database layer.
+
+Runs concurrent readers (24h window query, as used by ingestion matching)
+against concurrent writers (transaction inserts) on a scratch SQLite file,
+once with the default rollback journal and once with the tuned WAL pragmas.
+
+--mode async runs every reader and writer as a task on one event loop over
+aiosqlite, as the app does. --mode processes gives each reader and writer its
+own process and sync engine, so they contend for the database file the way the
+API, the poller and a rematch job running side by side do.
+
+    python -m benchmarks.db_concurrency --readers 8 --writers 2 --seconds 5
+    python -m benchmarks.db_concurrency --mode processes --readers 4 --writers 2 --write-rate 50
+"""
+import argparse, asyncio, os, tempfile, time, uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import Session, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.db import build_async_engine, build_engine
+from app.models import Transaction
+
+
+def _outside_window() -> datetime:
+    # writes land outside the readers' 24h window, so read cost does not grow with write throughput
+    return datetime.utcnow() - timedelta(hours=48)
+
+
+async def _run(url: str, tuned: bool, readers: int, writers: int, seconds: float, seed_rows: int):
+    eng = build_async_engine(url, tune_sqlite=tuned)
+    async with eng.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    Session = async_sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+
+    now = datetime.utcnow()
+    async with Session() as sess:
+        for i in range(seed_rows):
+            sess.add(Transaction(id=f"seed-{i}", timestamp=now - timedelta(minutes=i % 2880),
+                                 merchant="Seed", amount=float(i % 500)))
+        await sess.commit()
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    deadline = time.perf_counter() + seconds
+
+    async def reader():
+        cutoff = datetime.utcnow() - timedelta(hours=24)
+        while time.perf_counter() < deadline:
+            try:
+                async with Session() as sess:
+                    (await sess.exec(select(Transaction).where(Transaction.timestamp >= cutoff))).all()
+                counts["reads"] += 1
+            except Exception:
+                counts["errors"] += 1
+
+    async def writer():
+        while time.perf_counter() < deadline:
+            try:
+                async with Session() as sess:
+                    sess.add(Transaction(id=f"tx-{uuid.uuid4().hex}", timestamp=_outside_window(),
+                                         merchant="Bench", amount=1.0))
+                    await sess.commit()
+                counts["writes"] += 1
+            except Exception:
+                counts["errors"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[reader() for _ in range(readers)], *[writer() for _ in range(writers)])
+    elapsed = time.perf_counter() - started
+    await eng.dispose()
+    return {k: v / elapsed for k, v in counts.items()}
+
+
+def _seed(url: str, seed_rows: int):
+    eng = build_engine(url)
+    SQLModel.metadata.create_all(eng)
+    now = datetime.utcnow()
+    with Session(eng) as sess:
+        for i in range(seed_rows):
+            sess.add(Transaction(id=f"seed-{i}", timestamp=now - timedelta(minutes=i % 2880),
+                                 merchant="Seed", amount=float(i % 500)))
+        sess.commit()
+    eng.dispose()
+
+def _process_worker(url: str, tuned: bool, role: str, seconds: float, write_rate: float):
+    """One reader or writer loop in its own process; returns (ops, errors, op latencies in ms)."""
+    eng = build_engine(url, tune_sqlite=tuned)
+    ops, errors, latencies = 0, 0, []
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        if role == "write" and write_rate:
+            time.sleep(max(0.0, started + ops / write_rate - time.perf_counter()))
+        t0 = time.perf_counter()
+        try:
+            with Session(eng) as sess:
+                if role == "read":
+                    cutoff = datetime.utcnow() - timedelta(hours=24)
+                    sess.exec(select(Transaction).where(Transaction.timestamp >= cutoff)).all()
+                else:
+                    sess.add(Transaction(id=f"tx-{uuid.uuid4().hex}", timestamp=_outside_window(),
+                                         merchant="Bench", amount=1.0))
+                    sess.commit()
+            ops += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+        except Exception:
+            errors += 1
+    eng.dispose()
+    return ops, errors, latencies
+
+def _run_processes(url: str, tuned: bool, readers: int, writers: int, seconds: float, seed_rows: int, write_rate: float):
+    _seed(url, seed_rows)
+    roles = ["read"] * readers + ["write"] * writers
+    n = len(roles)
+    with ProcessPoolExecutor(n) as pool:
+        results = list(pool.map(_process_worker, [url] * n, [tuned] * n, roles, [seconds] * n, [write_rate] * n))
+    out = {"reads": 0.0, "writes": 0.0, "errors": 0.0}
+    read_latencies = []
+    for role, (ops, errors, latencies) in zip(roles, results):
+        out["reads" if role == "read" else "writes"] += ops / seconds
+        out["errors"] += errors / seconds
+        if role == "read":
+            read_latencies.extend(latencies)
+    read_latencies.sort()
+    out["read_p99_ms"] = read_latencies[int(0.99 * (len(read_latencies) - 1))] if read_latencies else 0.0
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--writers", type=int, default=2)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--seed-rows", type=int, default=5000)
+    ap.add_argument("--mode", choices=["async", "processes"], default="async")
+    ap.add_argument("--write-rate", type=float, default=50.0,
+                    help="inserts/s per writer process in --mode processes (0 = unthrottled)")
+    args = ap.parse_args()
+
+    for tuned in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            if args.mode == "processes":
+                res = _run_processes(url, tuned, args.readers, args.writers, args.seconds, args.seed_rows, args.write_rate)
+            else:
+                res = asyncio.run(_run(url, tuned, args.readers, args.writers, args.seconds, args.seed_rows))
+        label = "tuned (WAL)" if tuned else "default"
+        line = f"{label:12s} reads/s={res['reads']:8.1f}  writes/s={res['writes']:8.1f}  errors/s={res['errors']:6.2f}"
+        if "read_p99_ms" in res:
+            line += f"  read p99={res['read_p99_ms']:.1f}ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
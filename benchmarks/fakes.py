@@ -0,0 +1,294 @@
+"""
+Local stand-ins for the external services the agent talks to.
+
+FakeServices runs, on a background event loop thread:
+
+- a minimal IMAP4rev1 server (CAPABILITY/LOGIN/SELECT/SEARCH/FETCH/STORE/LOGOUT,
+  enough for app.email_reader and aioimaplib),
+- a Telex webhook that records every notification with its arrival time,
+- a Gemini generateContent endpoint that answers extraction prompts from a
+  registry of known alerts,
+- a transactions API serving whatever transactions the harness registers.
+
+Timestamps use time.perf_counter() so they can be compared with the driver's.
+"""
+import asyncio, json, random, re, socket, threading, time
+from typing import Any, Dict, List, Optional
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class LoopThread:
+    """An asyncio event loop running forever on a daemon thread."""
+
+    def __init__(self, name: str):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: Optional[float] = None):
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=10)
+
+
+def _bind_socket(host: str = "127.0.0.1") -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, 0))
+    sock.listen(1024)
+    return sock
+
+
+class HttpServer:
+    """uvicorn serving an ASGI app on an ephemeral port inside a LoopThread."""
+
+    def __init__(self, app, loop_thread: LoopThread, log_level: str = "warning", lifespan: str = "off"):
+        self.sock = _bind_socket()
+        self.port = self.sock.getsockname()[1]
+        self.loop_thread = loop_thread
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan=lifespan, access_log=False))
+        self._future = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 10.0):
+        self._future = self.loop_thread.submit(self.server.serve(sockets=[self.sock]))
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if self._future.done():
+                self._future.result()
+            if time.monotonic() > deadline:
+                raise RuntimeError("HTTP server did not start")
+            time.sleep(0.01)
+
+    def stop(self):
+        self.server.should_exit = True
+        if self._future:
+            self._future.result(timeout=10)
+
+
+class FakeImapServer:
+    """Single-INBOX IMAP server; messages are addressed by sequence number and never expunged."""
+
+    def __init__(self, user: str = "loadtest", password: str = "loadtest"):
+        self.user = user
+        self.password = password
+        self._lock = threading.Lock()
+        self._messages: List[bytes] = []
+        self._seen: List[bool] = []
+        self.logins = 0
+        self.port: Optional[int] = None
+        self._server = None
+
+    def deliver(self, raw: bytes):
+        with self._lock:
+            self._messages.append(raw)
+            self._seen.append(False)
+
+    def unseen_count(self) -> int:
+        with self._lock:
+            return self._seen.count(False)
+
+    async def start(self, host: str = "127.0.0.1") -> int:
+        self._server = await asyncio.start_server(self._handle, host, 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _seqs(self, spec: str) -> List[int]:
+        with self._lock:
+            total = len(self._messages)
+        out = []
+        for part in spec.split(","):
+            if ":" in part:
+                lo, hi = part.split(":")
+                lo = int(lo)
+                hi = total if hi == "*" else int(hi)
+                out.extend(range(lo, hi + 1))
+            elif part == "*":
+                out.append(total)
+            else:
+                out.append(int(part))
+        return [n for n in out if 1 <= n <= total]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b"* OK [CAPABILITY IMAP4rev1] fake IMAP ready\r\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                tag, _, rest = line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+                cmd, _, args = rest.partition(" ")
+                cmd = cmd.upper()
+                if cmd == "CAPABILITY":
+                    writer.write(b"* CAPABILITY IMAP4rev1\r\n")
+                    writer.write(f"{tag} OK CAPABILITY completed\r\n".encode())
+                elif cmd == "LOGIN":
+                    user, _, password = args.partition(" ")
+                    if user.strip('"') == self.user and password.strip('"') == self.password:
+                        self.logins += 1
+                        writer.write(f"{tag} OK LOGIN completed\r\n".encode())
+                    else:
+                        writer.write(f"{tag} NO LOGIN failed\r\n".encode())
+                elif cmd == "SELECT":
+                    with self._lock:
+                        total = len(self._messages)
+                    writer.write(f"* {total} EXISTS\r\n* 0 RECENT\r\n* FLAGS (\\Seen)\r\n".encode())
+                    writer.write(f"{tag} OK [READ-WRITE] SELECT completed\r\n".encode())
+                elif cmd == "SEARCH":
+                    with self._lock:
+                        unseen = [str(i + 1) for i, seen in enumerate(self._seen) if not seen]
+                    writer.write(("* SEARCH " + " ".join(unseen)).rstrip().encode() + b"\r\n")
+                    writer.write(f"{tag} OK SEARCH completed\r\n".encode())
+                elif cmd == "FETCH":
+                    spec, _, _parts = args.partition(" ")
+                    for n in self._seqs(spec):
+                        with self._lock:
+                            raw = self._messages[n - 1]
+                            self._seen[n - 1] = True
+                        writer.write(f"* {n} FETCH (RFC822 {{{len(raw)}}}\r\n".encode() + raw + b")\r\n")
+                    writer.write(f"{tag} OK FETCH completed\r\n".encode())
+                elif cmd == "STORE":
+                    spec, _, _flags = args.partition(" ")
+                    for n in self._seqs(spec):
+                        with self._lock:
+                            self._seen[n - 1] = True
+                        writer.write(f"* {n} FETCH (FLAGS (\\Seen))\r\n".encode())
+                    writer.write(f"{tag} OK STORE completed\r\n".encode())
+                elif cmd == "NOOP":
+                    writer.write(f"{tag} OK NOOP completed\r\n".encode())
+                elif cmd == "LOGOUT":
+                    writer.write(f"* BYE logging out\r\n{tag} OK LOGOUT completed\r\n".encode())
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(f"{tag} BAD unsupported command\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class FakeTelex:
+    """Webhook sink recording notification payloads by alert reference."""
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.received: Dict[str, float] = {}
+        self.count = 0
+        self.app = Starlette(routes=[Route("/webhook", self.webhook, methods=["POST"])])
+
+    async def webhook(self, request: Request):
+        payload = await request.json()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            return JSONResponse({"ok": False}, status_code=503)
+        self.count += 1
+        ref = (payload.get("metadata") or {}).get("reference")
+        if ref:
+            self.received.setdefault(ref, time.perf_counter())
+        return JSONResponse({"ok": True})
+
+
+class FakeGemini:
+    """generateContent stand-in that answers field-extraction prompts for registered references."""
+
+    REF_RE = re.compile(r"\bRef(?:erence)?[:\s]*([A-Z0-9\-]{4,30})\b", re.I)
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.alerts: Dict[str, Dict[str, Any]] = {}
+        self.calls = 0
+        self.app = Starlette(routes=[Route("/v1beta/models/{model}:generateContent", self.generate, methods=["POST"])])
+
+    async def generate(self, request: Request):
+        self.calls += 1
+        body = await request.json()
+        prompt = body["contents"][0]["parts"][0]["text"]
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        m = self.REF_RE.search(prompt)
+        fields = dict(self.alerts.get(m.group(1), {})) if m else {}
+        if m:
+            fields["reference"] = m.group(1)
+        text = "```json\n" + json.dumps(fields) + "\n```"
+        return JSONResponse({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+
+class FakeTransactionsApi:
+    """Serves the registered transactions as the bank's transaction feed."""
+
+    def __init__(self):
+        self.transactions: List[Dict[str, Any]] = []
+        self.app = Starlette(routes=[Route("/transactions", self.list_transactions, methods=["GET"])])
+
+    async def list_transactions(self, request: Request):
+        return JSONResponse(self.transactions)
+
+
+class FakeServices:
+    """Starts every fake on one background loop; exposes their URLs/ports."""
+
+    def __init__(self, telex_latency: float = 0.0, telex_failure_rate: float = 0.0, gemini_latency: float = 0.0):
+        self.loop_thread = LoopThread("fake-services")
+        self.imap = FakeImapServer()
+        self.telex = FakeTelex(telex_latency, telex_failure_rate)
+        self.gemini = FakeGemini(gemini_latency)
+        self.transactions = FakeTransactionsApi()
+        self._http: Dict[str, HttpServer] = {}
+
+    def start(self):
+        self.loop_thread.start()
+        self.loop_thread.run(self.imap.start())
+        for name, fake in (("telex", self.telex), ("gemini", self.gemini), ("transactions", self.transactions)):
+            server = HttpServer(fake.app, self.loop_thread)
+            server.start()
+            self._http[name] = server
+        return self
+
+    def stop(self):
+        for server in self._http.values():
+            server.stop()
+        self.loop_thread.run(self.imap.stop())
+        self.loop_thread.stop()
+
+    def environ(self) -> Dict[str, str]:
+        """Settings overrides pointing the app at the fakes."""
+        return {
+            "IMAP_HOST": "127.0.0.1",
+            "IMAP_PORT": str(self.imap.port),
+            "IMAP_USER": self.imap.user,
+            "IMAP_PASS": self.imap.password,
+            "IMAP_USE_SSL": "0",
+            "TELEX_WEBHOOK_URL": self._http["telex"].url + "/webhook",
+            "GEMINI_API_KEY": "loadtest",
+            "GEMINI_FALLBACK_ENABLED": "1",
+            "GEMINI_API_URL": self._http["gemini"].url + "/v1beta/models/gemini-pro:generateContent",
+            "TRANSACTIONS_SOURCE": "api",
+            "TRANSACTIONS_API_URL": self._http["transactions"].url + "/transactions",
+        }
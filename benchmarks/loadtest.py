@@ -0,0 +1,311 @@
+"""
+End-to-end load test against local stand-ins for IMAP, Telex, Gemini and the
+transactions API (see benchmarks/fakes.py). Nothing leaves the machine.
+
+Two targets:
+
+- ingest: alerts are delivered to the fake IMAP inbox at the offered rate and
+  travel email_reader.fetch_and_process -> ingest_email_payload -> Telex
+  webhook. Latency is delivery-to-notification.
+- process_alert: POST /process_alert against the app served by uvicorn in a
+  child process, so the load generator does not share its GIL.
+
+Each offered rate is held for --duration seconds with Poisson arrivals. A step
+is saturated when achieved throughput falls below 90% of the offered rate, p99
+exceeds --slo-ms, or more than 1% of requests fail. With --auto the rate doubles
+from --start-rate until the first saturated step.
+
+/process_alert responses of 429/503 are counted as shed by admission control,
+not as errors, and latency percentiles cover admitted requests only. Running
+at twice the saturation rate shows whether admitted p99 stays bounded.
+
+    python -m benchmarks.loadtest --target both --rates 2,5,10,20 --duration 10
+    python -m benchmarks.loadtest --target process_alert --auto --start-rate 50
+    python -m benchmarks.loadtest --target process_alert --ledger-size 2000 --rates 20,40,80
+"""
+import argparse, asyncio, os, random, socket, string, subprocess, sys, tempfile, time
+from email.message import EmailMessage
+from typing import Any, Dict, List, Optional
+from .fakes import FakeServices
+
+MERCHANTS = ["SHOPRITE", "STARBUCKS", "AMAZONPRCH", "UTILITYBILL", "GROCERYMART", "UBER", "NETFLIX"]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _letters(n: int, width: int = 6) -> str:
+    out = []
+    for _ in range(width):
+        n, r = divmod(n, 26)
+        out.append(string.ascii_uppercase[r])
+    return "".join(reversed(out))
+
+
+def summarize(offered: float, latencies: List[float], errors: int, total: int, elapsed: float, slo_ms: float, shed: int = 0) -> Dict[str, Any]:
+    achieved = len(latencies) / elapsed if elapsed > 0 else 0.0
+    error_rate = errors / total if total else 0.0
+    p99 = percentile(latencies, 99)
+    saturated = achieved < 0.9 * offered or error_rate > 0.01 or (p99 is not None and p99 * 1000 > slo_ms)
+    return {
+        "offered_rps": offered,
+        "achieved_rps": achieved,
+        "p50_ms": (percentile(latencies, 50) or 0.0) * 1000,
+        "p95_ms": (percentile(latencies, 95) or 0.0) * 1000,
+        "p99_ms": (p99 or 0.0) * 1000,
+        "error_rate": error_rate,
+        "shed_rate": shed / total if total else 0.0,
+        "requests": total,
+        "saturated": saturated,
+    }
+
+
+async def _poisson_arrivals(rate: float, duration: float, fire):
+    """Calls fire(i) at Poisson arrival times (open loop) for `duration` seconds; returns the count."""
+    start = time.perf_counter()
+    next_at = start
+    i = 0
+    while True:
+        next_at += random.expovariate(rate)
+        if next_at - start > duration:
+            return i
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        fire(i)
+        i += 1
+
+
+class IngestScenario:
+    """Drives the IMAP -> ingest -> Telex path in-process."""
+
+    def __init__(self, fakes: FakeServices, poll_interval: float, llm_fraction: float, drain_timeout: float):
+        self.fakes = fakes
+        self.poll_interval = poll_interval
+        self.llm_fraction = llm_fraction
+        self.drain_timeout = drain_timeout
+        self._seq = 0
+
+    def _make_alert(self) -> Dict[str, Any]:
+        from datetime import datetime
+        self._seq += 1
+        ref = "LT" + _letters(self._seq)
+        merchant = random.choice(MERCHANTS)
+        amount = round(random.uniform(1, 999), 2)
+        use_llm = random.random() < self.llm_fraction
+        if use_llm:
+            # no digits anywhere, so the regex parser finds no amount and ingestion asks Gemini
+            text = f"Your account was debited at {merchant}. Ref: {ref}"
+        else:
+            text = f"Your account was debited NGN {amount:.2f} at {merchant}. Ref: {ref}"
+        msg = EmailMessage()
+        msg["Subject"] = f"{merchant} Debit Alert"
+        msg["From"] = "alerts@bank.local"
+        msg["To"] = "agent@telex.local"
+        msg.set_content(text)
+        tx = {
+            "id": f"tx-{ref}",
+            "timestamp": datetime.utcnow().isoformat(),
+            "account_masked": "****1234",
+            "merchant": merchant,
+            "amount": amount,
+            "currency": "NGN",
+            "metadata": {"reference": ref},
+        }
+        return {"ref": ref, "raw": msg.as_bytes(), "tx": tx, "fields": {"amount": amount, "merchant": merchant}}
+
+    async def run_step(self, rate: float, duration: float, slo_ms: float) -> Dict[str, Any]:
+        from app.email_reader import fetch_and_process
+        from app.poller import refresh_transactions
+
+        planned = [self._make_alert() for _ in range(int(rate * duration * 1.5) + 10)]
+        for alert in planned:
+            self.fakes.gemini.alerts[alert["ref"]] = alert["fields"]
+        self.fakes.transactions.transactions.extend(a["tx"] for a in planned)
+        await refresh_transactions()
+
+        sent: Dict[str, float] = {}
+        stop = asyncio.Event()
+
+        async def consumer():
+            while not stop.is_set():
+                await fetch_and_process()
+                await asyncio.sleep(self.poll_interval)
+
+        def fire(i: int):
+            alert = planned[i]
+            sent[alert["ref"]] = time.perf_counter()
+            self.fakes.imap.deliver(alert["raw"])
+
+        consumer_task = asyncio.create_task(consumer())
+        started = time.perf_counter()
+        count = await _poisson_arrivals(rate, duration, fire)
+        received = self.fakes.telex.received
+        deadline = time.perf_counter() + self.drain_timeout
+        while time.perf_counter() < deadline and any(ref not in received for ref in sent):
+            await asyncio.sleep(0.05)
+        stop.set()
+        await consumer_task
+
+        latencies = [received[ref] - t0 for ref, t0 in sent.items() if ref in received]
+        last = max((received[ref] for ref in sent if ref in received), default=time.perf_counter())
+        return summarize(rate, latencies, count - len(latencies), count, last - started, slo_ms)
+
+
+class ProcessAlertScenario:
+    """Drives POST /process_alert against the app served by uvicorn in a child process."""
+
+    def __init__(self, timeout: float, ledger_size: Optional[int] = None):
+        import httpx
+        port = _free_port()
+        self.url = f"http://127.0.0.1:{port}"
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning", "--no-access-log"],
+            env=dict(os.environ), stdout=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(self.url + "/.well-known/agent.json", timeout=1.0)
+                break
+            except httpx.HTTPError:
+                if self.proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("app server did not start")
+                time.sleep(0.1)
+        if ledger_size:
+            httpx.post(self.url + "/ledger/re-poll", params={"count": ledger_size}, timeout=60.0).raise_for_status()
+        self.timeout = timeout
+
+    def admission_stats(self) -> Dict[str, Any]:
+        import httpx
+        return httpx.get(self.url + "/admin/admission", timeout=5.0).json()
+
+    def close(self):
+        self.proc.terminate()
+        self.proc.wait(timeout=10)
+
+    async def run_step(self, rate: float, duration: float, slo_ms: float) -> Dict[str, Any]:
+        import httpx
+        latencies: List[float] = []
+        errors = 0
+        shed = 0
+        tasks = []
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+        async with httpx.AsyncClient(base_url=self.url, timeout=self.timeout, limits=limits) as client:
+
+            async def one():
+                nonlocal errors, shed
+                merchant = random.choice(MERCHANTS)
+                text = f"Dear Customer, You made a purchase of $50.99 at {merchant} on {time.strftime('%Y-%m-%d')}."
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post("/process_alert", json={"email_content": text})
+                    if r.status_code == 200:
+                        latencies.append(time.perf_counter() - t0)
+                    elif r.status_code in (429, 503):
+                        shed += 1
+                    else:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+
+            started = time.perf_counter()
+            count = await _poisson_arrivals(rate, duration, lambda i: tasks.append(asyncio.create_task(one())))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+        return summarize(rate, latencies, errors, count, elapsed, slo_ms, shed)
+
+
+def _print_table(target: str, rows: List[Dict[str, Any]]):
+    print(f"\n== {target} ==")
+    print(f"{'offered/s':>10} {'achieved/s':>11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8} {'shed':>8} {'n':>7}  state")
+    rows = sorted(rows, key=lambda r: r["offered_rps"])
+    for r in rows:
+        print(f"{r['offered_rps']:10.1f} {r['achieved_rps']:11.1f} {r['p50_ms']:9.1f} {r['p95_ms']:9.1f} "
+              f"{r['p99_ms']:9.1f} {r['error_rate']*100:7.2f}% {r['shed_rate']*100:7.2f}% {r['requests']:7d}  {'SATURATED' if r['saturated'] else 'ok'}")
+    first_bad = next((i for i, r in enumerate(rows) if r["saturated"]), None)
+    if first_bad is not None:
+        # the highest rate that still held, below the first one that did not
+        knee = rows[first_bad - 1]["offered_rps"] if first_bad else 0.0
+        print(f"saturation point: between {knee:.1f}/s and {rows[first_bad]['offered_rps']:.1f}/s offered")
+    else:
+        print("no saturation observed at the tested rates")
+
+
+async def _sweep(scenario, rates: List[float], auto: bool, start_rate: float, max_steps: int, duration: float, slo_ms: float):
+    rows = []
+    if auto:
+        rate = start_rate
+        for _ in range(max_steps):
+            row = await scenario.run_step(rate, duration, slo_ms)
+            rows.append(row)
+            if row["saturated"]:
+                break
+            rate *= 2
+    else:
+        for rate in rates:
+            rows.append(await scenario.run_step(rate, duration, slo_ms))
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--target", choices=["ingest", "process_alert", "both"], default="both")
+    ap.add_argument("--rates", default="2,5,10,20", help="comma-separated offered rates (alerts/s)")
+    ap.add_argument("--auto", action="store_true", help="double the rate from --start-rate until saturation")
+    ap.add_argument("--start-rate", type=float, default=5.0)
+    ap.add_argument("--max-steps", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds per step")
+    ap.add_argument("--slo-ms", type=float, default=2000.0, help="p99 latency above which a step counts as saturated")
+    ap.add_argument("--poll-interval", type=float, default=0.2, help="IMAP poll interval for the ingest target")
+    ap.add_argument("--llm-fraction", type=float, default=0.1, help="share of alerts that need Gemini extraction")
+    ap.add_argument("--drain-timeout", type=float, default=30.0)
+    ap.add_argument("--request-timeout", type=float, default=30.0)
+    ap.add_argument("--ledger-size", type=int, default=None, help="re-poll the mock ledger with this many entries")
+    ap.add_argument("--telex-latency", type=float, default=0.0)
+    ap.add_argument("--telex-failure-rate", type=float, default=0.0)
+    ap.add_argument("--gemini-latency", type=float, default=0.0)
+    args = ap.parse_args()
+
+    fakes = FakeServices(args.telex_latency, args.telex_failure_rate, args.gemini_latency).start()
+    tmp = tempfile.TemporaryDirectory()
+    # settings and engines are read at import time, so point them at the fakes before importing app
+    os.environ.update(fakes.environ())
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'loadtest.db')}"
+    from app.db import init_db_async
+
+    rates = [float(r) for r in args.rates.split(",") if r.strip()]
+    try:
+        asyncio.run(init_db_async())
+        if args.target in ("ingest", "both"):
+            scenario = IngestScenario(fakes, args.poll_interval, args.llm_fraction, args.drain_timeout)
+            rows = asyncio.run(_sweep(scenario, rates, args.auto, args.start_rate, args.max_steps, args.duration, args.slo_ms))
+            _print_table("ingest (IMAP -> ingest -> Telex)", rows)
+            print(f"gemini calls: {fakes.gemini.calls}, imap logins: {fakes.imap.logins}")
+        if args.target in ("process_alert", "both"):
+            scenario = ProcessAlertScenario(args.request_timeout, args.ledger_size)
+            try:
+                rows = asyncio.run(_sweep(scenario, rates, args.auto, args.start_rate, args.max_steps, args.duration, args.slo_ms))
+                _print_table("POST /process_alert", rows)
+                print(f"admission: {scenario.admission_stats()}")
+            finally:
+                scenario.close()
+    finally:
+        fakes.stop()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Lookup latency of the trigram merchant index against a brute-force scan.
+
+Builds a MerchantIndex over `--size` distinct synthetic merchant descriptions,
+then searches for typo'd copies of indexed names and reports p50/p95/p99 latency
+and how often the best result was the original name (or one as close). A few of
+the same queries are also run as a full rapidfuzz scan for comparison.
+
+    python -m benchmarks.merchant_index --size 1000000 --queries 500
+"""
+import argparse, random, statistics, string, time
+from rapidfuzz import fuzz, process
+from app.merchant_index import MerchantIndex, normalize_description
+
+SYLLABLES = [a + b for a in "bcdfghjklmnprstvwz" for b in "aeiou"] + ["ng", "sh", "ch", "th", "kw", "mart", "tech"]
+SUFFIXES = ["stores", "ltd", "ventures", "pos", "mall", "pharmacy", "foods", "enterprises", "global", "hub"]
+CITIES = ["lagos", "abuja", "ikeja", "lekki", "yaba", "kano", "ibadan", "enugu", "jos", "benin"]
+
+
+def make_descriptions(size: int, seed: int) -> list:
+    rng = random.Random(seed)
+    seen = set()
+    while len(seen) < size:
+        words = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 2))]
+        if rng.random() < 0.6:
+            words.append(rng.choice(SUFFIXES))
+        if rng.random() < 0.4:
+            words.append(rng.choice(CITIES))
+        seen.add(" ".join(words))
+    return list(seen)
+
+def typo(name: str, rng: random.Random) -> str:
+    chars = list(name)
+    i = rng.randrange(len(chars))
+    op = rng.choice(["substitute", "delete", "insert"])
+    if op == "substitute":
+        chars[i] = rng.choice(string.ascii_lowercase)
+    elif op == "delete" and len(chars) > 4:
+        del chars[i]
+    else:
+        chars.insert(i, rng.choice(string.ascii_lowercase))
+    return "".join(chars).upper()
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", type=int, default=1_000_000, help="distinct descriptions to index")
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--limit", type=int, default=10)
+    ap.add_argument("--cutoff", type=float, default=70.0)
+    ap.add_argument("--brute-force", type=int, default=20, help="queries to also run as a full scan")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"generating {args.size} descriptions...")
+    names = make_descriptions(args.size, args.seed)
+
+    index = MerchantIndex()
+    started = time.perf_counter()
+    index.add_many(names)
+    build = time.perf_counter() - started
+    print(f"built index of {len(index)} names in {build:.1f}s ({len(index) / build:.0f} adds/s)")
+
+    targets = [rng.choice(names) for _ in range(args.queries)]
+    queries = [typo(t, rng) for t in targets]
+    latencies, found = [], 0
+    for target, query in zip(targets, queries):
+        t0 = time.perf_counter()
+        results = index.search(query, args.limit, args.cutoff)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        # a different name scoring at least as well as the original counts as found
+        found += int(bool(results) and results[0][1] >= fuzz.ratio(normalize_description(query), target))
+    print(f"index search: p50={percentile(latencies, 0.50):.2f}ms p95={percentile(latencies, 0.95):.2f}ms "
+          f"p99={percentile(latencies, 0.99):.2f}ms mean={statistics.mean(latencies):.2f}ms "
+          f"top-1 recall={found / len(queries):.1%}")
+
+    if args.brute_force:
+        scan, agree = [], 0
+        for target, query in list(zip(targets, queries))[:args.brute_force]:
+            q = normalize_description(query)
+            t0 = time.perf_counter()
+            best = process.extract(q, names, scorer=fuzz.ratio, score_cutoff=args.cutoff, limit=args.limit)
+            scan.append((time.perf_counter() - t0) * 1000)
+            agree += int(bool(best) and best[0][1] == (index.search(query, 1, args.cutoff) or [(None, None)])[0][1])
+        print(f"full scan ({len(scan)} queries): p50={percentile(scan, 0.50):.2f}ms "
+              f"p99={percentile(scan, 0.99):.2f}ms, index found the scan's best score in {agree}/{len(scan)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import asyncio
+import pytest
+from app.admission import AdmissionController, AdmissionRejected
+
+
+def test_queue_full_is_shed_with_429():
+    async def scenario():
+        ctl = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=1.0)
+        await ctl.acquire()
+        waiter = asyncio.create_task(ctl.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as exc:
+            await ctl.acquire()
+        assert exc.value.status_code == 429
+        assert exc.value.retry_after >= 1
+        ctl.release()
+        await waiter
+        ctl.release()
+        return ctl.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["active"] == 0
+    assert stats["queue_depth"] == 0
+    assert stats["admitted"] == 2
+    assert stats["shed_queue_full"] == 1
+
+
+def test_queue_deadline_is_shed_with_503():
+    async def scenario():
+        ctl = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        await ctl.acquire()
+        with pytest.raises(AdmissionRejected) as exc:
+            await ctl.acquire()
+        ctl.release()
+        return exc.value, ctl.stats()
+
+    exc, stats = asyncio.run(scenario())
+    assert exc.status_code == 503
+    assert stats["shed_timeout"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_high_priority_is_admitted_first_and_displaces_low():
+    async def scenario():
+        ctl = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=1.0)
+        order = []
+
+        async def request(name, priority):
+            async with ctl.slot(priority):
+                order.append(name)
+
+        await ctl.acquire()
+        low = asyncio.create_task(request("low", "low"))
+        await asyncio.sleep(0)
+        high = asyncio.create_task(request("high", "high"))
+        await asyncio.sleep(0)
+        ctl.release()
+        await high
+        with pytest.raises(AdmissionRejected):
+            await low
+        return order, ctl.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["high"]
+    assert stats["shed_displaced"] == 1
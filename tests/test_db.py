@@ -0,0 +1,78 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import asyncio
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app import db
+from app.config import settings
+from app.models import Transaction
+from datetime import datetime
+
+
+def _pragma(eng, name):
+    with eng.connect() as conn:
+        return conn.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_file_database_gets_wal_and_pragmas(tmp_path):
+    url = f"sqlite:///{tmp_path / 'tuned.db'}"
+    eng = db.build_engine(url)
+    assert _pragma(eng, "journal_mode").lower() == settings.SQLITE_JOURNAL_MODE.lower()
+    assert _pragma(eng, "synchronous") == {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3}[settings.SQLITE_SYNCHRONOUS.upper()]
+    assert _pragma(eng, "cache_size") == settings.SQLITE_CACHE_SIZE
+    assert _pragma(eng, "busy_timeout") == settings.SQLITE_BUSY_TIMEOUT_MS
+    eng.dispose()
+
+    plain = db.build_engine(f"sqlite:///{tmp_path / 'plain.db'}", tune_sqlite=False)
+    assert _pragma(plain, "journal_mode").lower() == "delete"
+    plain.dispose()
+
+
+def test_in_memory_database_shares_one_connection():
+    assert db.async_database_url("sqlite:///:memory:") == "sqlite+aiosqlite:///:memory:"
+    assert db.async_database_url("postgresql://u@h/d") == "postgresql+asyncpg://u@h/d"
+
+    eng = db.build_engine("sqlite:///:memory:")
+    assert isinstance(eng.pool, StaticPool)
+    SQLModel.metadata.create_all(eng)
+    with eng.connect() as conn:
+        # a second checkout still sees the tables created on the first
+        assert conn.execute(text("SELECT count(*) FROM \"transaction\"")).scalar() == 0
+    assert isinstance(db.build_async_engine("sqlite:///:memory:").sync_engine.pool, StaticPool)
+
+
+def test_async_session_scope_commits_and_rolls_back(monkeypatch):
+    async def scenario():
+        eng = db.build_async_engine("sqlite:///:memory:")
+        async with eng.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        monkeypatch.setattr(db, "AsyncSessionLocal", async_sessionmaker(eng, class_=AsyncSession, expire_on_commit=False))
+
+        async with db.async_session_scope() as sess:
+            sess.add(Transaction(id="kept", timestamp=datetime(2025, 11, 3), amount=1.0))
+        with pytest.raises(RuntimeError):
+            async with db.async_session_scope() as sess:
+                sess.add(Transaction(id="dropped", timestamp=datetime(2025, 11, 3), amount=2.0))
+                await sess.flush()
+                raise RuntimeError("boom")
+
+        async with db.async_session_scope() as sess:
+            ids = (await sess.exec(select(Transaction.id))).all()
+        await eng.dispose()
+        return ids
+
+    assert asyncio.run(scenario()) == ["kept"]
+
+
+def test_transaction_watermark_does_not_scan_the_table():
+    from sqlalchemy import func
+    eng = db.build_engine("sqlite:///:memory:")
+    SQLModel.metadata.create_all(eng)
+    stmt = select(func.max(Transaction.timestamp))
+    with eng.connect() as conn:
+        plan = " ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {stmt.compile(eng)}")))
+    assert "INDEX" in plan and "SCAN" not in plan, plan
@@ -46,4 +46,144 @@ def test_ledger_endpoints():
 
     r2 = client.post("/ledger/re-poll")
     assert r2.status_code == 200
-    assert "message" in r2.json()
\ No newline at end of file
+    assert "message" in r2.json()
+
+def test_ledger_etag_and_pagination():
+    """The ledger ETag yields 304 until the ledger changes; pages follow X-Next-Cursor."""
+    client.post("/ledger/re-poll")
+    r1 = client.get("/ledger")
+    etag = r1.headers["etag"]
+    assert client.get("/ledger", headers={"If-None-Match": etag}).status_code == 304
+
+    full = r1.json()
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/ledger", params=params)
+        seen.extend(page.json())
+        cursor = page.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert seen == full
+
+    client.post("/ledger/re-poll")
+    r2 = client.get("/ledger", headers={"If-None-Match": etag})
+    assert r2.status_code == 200
+    assert r2.headers["etag"] != etag
+
+
+def test_repeated_alert_hits_match_cache_until_ledger_changes():
+    """Identical alerts reuse the scoring result until the ledger generation moves."""
+    client.post("/ledger/re-poll")
+    email_text = "Dear Customer, You made a purchase of $999.99 at NOWHEREMART on 2025-11-03."
+    before = client.get("/admin/match_cache").json()["ledger"]
+
+    first = client.post("/process_alert", json={"email_content": email_text}).json()
+    second = client.post("/process_alert", json={"email_content": email_text}).json()
+    assert first == second
+    after = client.get("/admin/match_cache").json()["ledger"]
+    assert after["hits"] == before["hits"] + 1
+
+    client.post("/ledger/re-poll")
+    client.post("/process_alert", json={"email_content": email_text})
+    stats = client.get("/admin/match_cache").json()["ledger"]
+    assert stats["generation"] > after["generation"]
+    assert stats["hits"] == after["hits"]
+
+
+def test_ledger_reads_during_re_poll_never_see_a_partial_ledger():
+    """A snapshot taken while the ledger is being refilled is the old ledger or the new one, never a mix."""
+    import threading
+    from app import main
+
+    main.generate_mock_ledger(5)
+    old_generation, old_entries = main.ledger_snapshot()
+    refill = threading.Thread(target=main.generate_mock_ledger, args=(50_000,))
+    refill.start()
+    seen = []
+    while refill.is_alive():
+        seen.append(main.ledger_snapshot())
+    refill.join()
+
+    generation, ledger, merchants = main.ledger_state()
+    final_generation, final_entries = main.ledger_snapshot()
+    assert final_generation == generation
+    assert len(final_entries) == len(ledger)
+    for seen_generation, entries in seen:
+        assert (seen_generation, len(entries)) in {(old_generation, len(old_entries)), (generation, len(ledger))}
+    assert len(merchants) == len({tx["description"] for tx in ledger.values()})
+
+
+def test_mailtrap_fetch_skips_when_unconfigured_and_maps_api_errors(monkeypatch, tmp_path):
+    """An unconfigured inbox is a no-op; an unreachable Mailtrap API is a 502, not a 500."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from sqlmodel import SQLModel
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    from app import db, email_reader_mailtrap
+    from app.config import settings
+
+    url = f"sqlite:///{tmp_path / 'mail.db'}"
+    SQLModel.metadata.create_all(db.build_engine(url))
+    monkeypatch.setattr(db, "AsyncSessionLocal", async_sessionmaker(db.build_async_engine(url), class_=AsyncSession))
+
+    monkeypatch.setattr(settings, "MAILTRAP_ACCOUNT_ID", "")
+    r = client.get("/mailtrap/fetch")
+    assert r.status_code == 200
+    assert r.json()["message_count"] == 0
+
+    monkeypatch.setattr(settings, "MAILTRAP_ACCOUNT_ID", "1")
+    monkeypatch.setattr(settings, "MAILTRAP_INBOX_ID", "2")
+    monkeypatch.setattr(settings, "MAILTRAP_INBOX_API_URL", "http://127.0.0.1:9/api")
+    monkeypatch.setattr(email_reader_mailtrap, "_reader", None)
+    r = client.get("/mailtrap/fetch")
+    assert r.status_code == 502
+
+
+def test_fail_artifact_reports_the_exact_score_of_the_best_row():
+    """Descriptions below the index cutoff still count towards the reported match_score."""
+    from datetime import datetime
+    from app import main
+
+    def post(*txs):
+        merchants = main.MerchantIndex()
+        merchants.add_many(tx.description for tx in txs)
+        main.bump_ledger_generation({tx.tx_id: tx.model_dump() for tx in txs}, merchants)
+        email_text = f"You made a purchase of $50.99 at AMAZONPRCH on {datetime.now().date().isoformat()}."
+        artifact = client.post("/process_alert", json={"email_content": email_text}).json()
+        scores = [main.calculate_match_score(main.parse_email_alert(email_text), tx.model_dump()) for tx in txs]
+        return artifact, scores
+
+    zara = main.PolledTransaction(tx_id="TX-FAIL", amount=50.99, description="ZARA MALL", polled_at=datetime.now())
+    artifact, (expected,) = post(zara)
+    assert artifact["match_found"] is False
+    assert artifact["match_score"] == expected > 0.60
+
+    # both rows tie on the index score; only the second one's description adds to it
+    tx1 = main.PolledTransaction(tx_id="TX1", amount=50.99, description="QQQQQQQQ", polled_at=datetime.now())
+    tx2 = main.PolledTransaction(tx_id="TX2", amount=50.99, description="AMAZ MKT", polled_at=datetime.now())
+    artifact, scores = post(tx1, tx2)
+    assert scores == [0.60, 0.79]
+    assert artifact["match_found"] is False
+    assert artifact["match_score"] == 0.79
+    assert "Highest score was 79.00%" in artifact["message"]
+    main.generate_mock_ledger()
+
+
+def test_ledger_response_cache_is_bounded_by_bytes(monkeypatch):
+    """Varying a filter cannot pin more serialized pages than the byte budget allows."""
+    from app.match_cache import ledger_response_cache
+
+    client.post("/ledger/re-poll", params={"count": 2000})
+    full = client.get("/ledger")
+    monkeypatch.setattr(ledger_response_cache, "max_bytes", len(full.content) * 3)
+    for i in range(20):
+        assert client.get("/ledger", params={"min_amount": -100 + i * 0.01}).status_code == 200
+    stats = client.get("/admin/match_cache").json()["ledger_responses"]
+    assert 0 < stats["bytes"] <= stats["max_bytes"]
+    assert stats["evictions"] > 0
+
+    hits = stats["hits"]
+    assert client.get("/ledger", params={"min_amount": -100 + 19 * 0.01}).content == client.get(
+        "/ledger", params={"min_amount": -100 + 19 * 0.01}).content
+    assert client.get("/admin/match_cache").json()["ledger_responses"]["hits"] >= hits + 2
+    client.post("/ledger/re-poll")
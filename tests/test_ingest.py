@@ -0,0 +1,193 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import asyncio
+import json
+from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app import db, main, poller
+from app.config import settings
+from app.email_parser import parse_email
+from app.match_cache import ingest_match_cache
+from app.models import MatchRun, Transaction
+from app.shards import account_shards
+
+
+async def _memory_db(monkeypatch):
+    """Points every async_session_scope() at a fresh in-memory database."""
+    eng = db.build_async_engine("sqlite:///:memory:")
+    async with eng.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    monkeypatch.setattr(db, "AsyncSessionLocal", async_sessionmaker(eng, class_=AsyncSession, expire_on_commit=False))
+    monkeypatch.setattr(poller, "_TRANSACTIONS_WATERMARK", None)
+    ingest_match_cache.clear()
+    account_shards.invalidate()
+    return eng
+
+
+def _quiet_telex(monkeypatch):
+    sent = []
+    async def fake_send(channel_id, title, body, meta=None):
+        sent.append(meta)
+    monkeypatch.setattr(main, "send_telex_message", fake_send)
+    return sent
+
+
+async def _runs():
+    async with db.async_session_scope() as sess:
+        return (await sess.exec(select(MatchRun).order_by(MatchRun.created_at))).all()
+
+
+def test_gemini_fallback_only_runs_when_enabled(monkeypatch):
+    calls = []
+    async def fake_extract(text):
+        calls.append(text)
+        return {"amount": 150.0, "merchant": "SHOPRITE", "reference": "ABC12345"}
+    monkeypatch.setattr(main, "extract_alert_fields", fake_extract)
+    monkeypatch.setattr(settings, "GEMINI_API_KEY", "test-key")
+    _quiet_telex(monkeypatch)
+    email = {"subject": "Debit alert", "sender": "bank@example.com", "body": "Your account was debited at SHOPRITE."}
+
+    async def scenario():
+        eng = await _memory_db(monkeypatch)
+        monkeypatch.setattr(settings, "GEMINI_FALLBACK_ENABLED", False)
+        await main.ingest_email_payload(email, parse_email(email))
+        assert calls == []
+        monkeypatch.setattr(settings, "GEMINI_FALLBACK_ENABLED", True)
+        await main.ingest_email_payload(email, parse_email(email))
+        assert len(calls) == 1
+        assert len(await _runs()) == 2
+        await eng.dispose()
+
+    asyncio.run(scenario())
+
+
+async def _insert_elsewhere(**fields):
+    """Writes a transaction through its own session, bypassing store_transactions."""
+    async with db.async_session_scope() as sess:
+        sess.add(Transaction(**fields))
+
+
+def _shoprite_alert(ref="ABC12345"):
+    return {
+        "subject": "SHOPRITE Debit Alert",
+        "sender": "bank@example.com",
+        "body": f"NGN 150.00 was debited from ****9999 at SHOPRITE on 2025-11-03. Ref: {ref}",
+    }
+
+
+def test_ingest_cache_sees_transactions_written_by_another_process(monkeypatch):
+    _quiet_telex(monkeypatch)
+    email = _shoprite_alert()
+
+    async def scenario():
+        eng = await _memory_db(monkeypatch)
+        await main.ingest_email_payload(email, parse_email(email))
+        await _insert_elsewhere(id="tx-a", timestamp=datetime.utcnow() - timedelta(minutes=5), account_masked="****9999",
+                                merchant="SHOPRITE", amount=150.0, extra_data=json.dumps({"reference": "ABC12345"}))
+        await main.ingest_email_payload(email, parse_email(email))
+        runs = await _runs()
+        await eng.dispose()
+        return runs
+
+    first, second = asyncio.run(scenario())
+    assert first.status == "no_match"
+    assert (second.status, second.chosen_tx_id) == ("matched", "tx-a")
+
+
+def test_ingest_cache_hit_drops_candidates_that_aged_out(monkeypatch):
+    _quiet_telex(monkeypatch)
+    email = _shoprite_alert()
+    stamp = datetime.utcnow() - timedelta(minutes=5)
+
+    async def scenario():
+        eng = await _memory_db(monkeypatch)
+        await _insert_elsewhere(id="tx-a", timestamp=stamp, account_masked="****9999",
+                                merchant="SHOPRITE", amount=150.0, extra_data=json.dumps({"reference": "ABC12345"}))
+        await main.ingest_email_payload(email, parse_email(email))
+        hits = ingest_match_cache.hits
+        # a day later the transaction has left the 24h window
+        monkeypatch.setattr(main, "recent_cutoff", lambda window_hours=24: stamp + timedelta(minutes=1))
+        await main.ingest_email_payload(email, parse_email(email))
+        assert ingest_match_cache.hits == hits + 1
+        runs = await _runs()
+        await eng.dispose()
+        return runs
+
+    first, second = asyncio.run(scenario())
+    assert (first.status, first.chosen_tx_id) == ("matched", "tx-a")
+    assert second.status == "no_match" and second.chosen_tx_id is None
+
+
+def test_alert_with_a_date_is_not_partitioned_on_the_year(monkeypatch):
+    """'2025' parsed from the date is not an account: the alert is scored against the full window."""
+    _quiet_telex(monkeypatch)
+    email = {
+        "subject": "SHOPRITE Debit Alert",
+        "sender": "bank@example.com",
+        "body": "Your account was debited NGN 150.00 at SHOPRITE on 2025-11-03. Ref: ABC12345",
+    }
+    assert parse_email(email)["account_masked"] == "2025"
+
+    async def scenario():
+        eng = await _memory_db(monkeypatch)
+        now = datetime.utcnow()
+        await _insert_elsewhere(id="tx-a", timestamp=now - timedelta(minutes=2), account_masked="****9999",
+                                merchant="SHOPRITE", amount=150.0, extra_data=json.dumps({"reference": "ABC12345"}))
+        await _insert_elsewhere(id="tx-b", timestamp=now - timedelta(minutes=3), account_masked="****2025",
+                                merchant="UBER", amount=12.0)
+        await main.ingest_email_payload(email, parse_email(email))
+        runs = await _runs()
+        await eng.dispose()
+        return runs
+
+    (run,) = asyncio.run(scenario())
+    assert (run.status, run.chosen_tx_id) == ("matched", "tx-a")
+
+
+def test_ingest_sees_older_rows_stored_by_another_worker(monkeypatch):
+    """A row older than the newest one leaves max(timestamp) alone; the writer's version bump catches it."""
+    _quiet_telex(monkeypatch)
+    email = _shoprite_alert()
+
+    async def scenario():
+        eng = await _memory_db(monkeypatch)
+        now = datetime.utcnow()
+        await _insert_elsewhere(id="tx-new", timestamp=now - timedelta(minutes=1), account_masked="****9999",
+                                merchant="UBER", amount=12.0)
+        await main.ingest_email_payload(email, parse_email(email))
+        # what store_transactions does in another process
+        async with db.async_session_scope() as sess:
+            sess.add(Transaction(id="tx-a", timestamp=now - timedelta(hours=6), account_masked="****9999",
+                                 merchant="SHOPRITE", amount=150.0, extra_data=json.dumps({"reference": "ABC12345"})))
+            await poller._bump_table_version(sess, "transaction")
+        await main.ingest_email_payload(email, parse_email(email))
+        runs = await _runs()
+        await eng.dispose()
+        return runs
+
+    first, second = asyncio.run(scenario())
+    assert first.chosen_tx_id == "tx-new" and first.status == "no_match"
+    assert (second.status, second.chosen_tx_id) == ("matched", "tx-a")
+
+
+def test_lifespan_runs_the_transaction_poller_until_shutdown(monkeypatch):
+    refreshed = []
+
+    async def fake_refresh():
+        refreshed.append(datetime.utcnow())
+
+    monkeypatch.setattr(poller, "refresh_transactions", fake_refresh)
+    monkeypatch.setattr(settings, "TRANSACTIONS_POLL_INTERVAL_SECONDS", 3600)
+
+    async def scenario():
+        eng = await _memory_db(monkeypatch)
+        monkeypatch.setattr(db, "async_engine", eng)
+        async with main.lifespan(main.app):
+            await asyncio.sleep(0.05)
+            assert len(refreshed) == 1
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+        await eng.dispose()
+
+    asyncio.run(scenario())
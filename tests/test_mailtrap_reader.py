@@ -0,0 +1,208 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import asyncio
+import re
+import httpx
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app import db
+from app.email_reader_mailtrap import MailtrapInboxReader, claim_message
+
+PAGE_SIZE = 30
+
+
+class StubMailtrapApi:
+    """In-memory stand-in for the Mailtrap sandbox messages API."""
+
+    def __init__(self, count: int):
+        self.messages = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.body_requests = 0
+        self.add(count)
+
+    def add(self, count: int):
+        start = len(self.messages) + 1
+        for i in range(start, start + count):
+            self.messages.append({
+                "id": 1000 + i,
+                "subject": f"Debit Alert {i}",
+                "from_email": "alerts@bank.local",
+                "created_at": "2025-11-03T10:00:00Z",
+            })
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        assert request.headers["Api-Token"] == "token"
+        path = request.url.path
+        m = re.fullmatch(r"/api/accounts/1/inboxes/2/messages/(\d+)/body\.txt", path)
+        if m:
+            self.body_requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0)
+            self.in_flight -= 1
+            return httpx.Response(200, text=f"Body of {m.group(1)}")
+        assert path == "/api/accounts/1/inboxes/2/messages"
+        page = int(request.url.params.get("page", "1"))
+        newest_first = list(reversed(self.messages))
+        return httpx.Response(200, json=newest_first[(page - 1) * PAGE_SIZE: page * PAGE_SIZE])
+
+
+def _reader(api: StubMailtrapApi, concurrency: int = 16, **kwargs) -> MailtrapInboxReader:
+    return MailtrapInboxReader("1", "2", "token", base_url="https://mailtrap.test/api",
+                               concurrency=concurrency, transport=httpx.MockTransport(api.handler), **kwargs)
+
+
+async def _accept(message):
+    pass
+
+
+def test_reader_fetches_thousands_of_messages_concurrently():
+    api = StubMailtrapApi(3000)
+
+    async def scenario():
+        reader = _reader(api)
+        try:
+            return await reader.poll(_accept), reader.last_seen_id
+        finally:
+            await reader.aclose()
+
+    messages, last_seen = asyncio.run(scenario())
+    assert len(messages) == 3000
+    assert [m["id"] for m in messages] == sorted(m["id"] for m in messages)
+    assert messages[0]["body"] == f"Body of {messages[0]['id']}"
+    assert last_seen == 4000
+    assert 1 < api.max_in_flight <= 16
+
+
+def test_reader_only_fetches_new_mail_on_later_polls():
+    api = StubMailtrapApi(100)
+
+    async def scenario():
+        reader = _reader(api, concurrency=4)
+        try:
+            first = await reader.poll(_accept)
+            again = await reader.poll(_accept)
+            api.add(5)
+            requests_before = api.body_requests
+            newer = await reader.poll(_accept)
+            return first, again, newer, api.body_requests - requests_before
+        finally:
+            await reader.aclose()
+
+    first, again, newer, new_body_requests = asyncio.run(scenario())
+    assert len(first) == 100
+    assert again == []
+    assert [m["id"] for m in newer] == [1101, 1102, 1103, 1104, 1105]
+    assert new_body_requests == 5
+
+
+def test_failed_ingest_is_retried_and_later_mail_is_not_skipped():
+    api = StubMailtrapApi(10)
+    ingested = []
+    fail_on = {1005}
+
+    async def ingest(message):
+        if message["id"] in fail_on:
+            fail_on.discard(message["id"])
+            raise RuntimeError("database unavailable")
+        ingested.append(message["id"])
+
+    async def scenario():
+        reader = _reader(api, concurrency=4)
+        try:
+            first = await reader.poll(ingest)
+            cursor = reader.last_seen_id
+            second = await reader.poll(ingest)
+            return first, cursor, second
+        finally:
+            await reader.aclose()
+
+    first, cursor, second = asyncio.run(scenario())
+    assert [m["id"] for m in first] == [1001, 1002, 1003, 1004]
+    assert cursor == 1004
+    assert [m["id"] for m in second] == list(range(1005, 1011))
+    assert ingested == list(range(1001, 1011))
+
+
+def test_concurrent_polls_ingest_each_message_once():
+    api = StubMailtrapApi(50)
+    ingested = []
+
+    async def ingest(message):
+        await asyncio.sleep(0)
+        ingested.append(message["id"])
+
+    async def scenario():
+        reader = _reader(api, concurrency=4)
+        try:
+            await asyncio.gather(reader.poll(ingest), reader.poll(ingest), reader.poll(ingest))
+        finally:
+            await reader.aclose()
+
+    asyncio.run(scenario())
+    assert sorted(ingested) == list(range(1001, 1051))
+
+
+def test_only_the_oldest_max_pages_are_fetched_and_the_rest_is_not_skipped():
+    api = StubMailtrapApi(100)
+
+    async def scenario():
+        reader = _reader(api, concurrency=4, max_pages=2)
+        try:
+            polls = [await reader.poll(_accept), await reader.poll(_accept)]
+            api.add(100)  # more new mail than two pages hold, on top of the cursor
+            polls += [await reader.poll(_accept), await reader.poll(_accept), await reader.poll(_accept)]
+            return polls
+        finally:
+            await reader.aclose()
+
+    polls = asyncio.run(scenario())
+    assert [[m["id"] for m in p] for p in polls] == [
+        list(range(1001, 1061)), list(range(1061, 1101)),
+        list(range(1101, 1161)), list(range(1161, 1201)), [],
+    ]
+
+
+SOURCE = "mailtrap:1:2"
+
+
+def _file_db(monkeypatch, tmp_path):
+    url = f"sqlite:///{tmp_path / 'mail.db'}"
+    SQLModel.metadata.create_all(db.build_engine(url))
+    eng = db.build_async_engine(url)
+    monkeypatch.setattr(db, "AsyncSessionLocal", async_sessionmaker(eng, class_=AsyncSession))
+    return eng
+
+
+def test_cursor_survives_restarts_and_is_shared_between_workers(monkeypatch, tmp_path):
+    api = StubMailtrapApi(10)
+    ingested = []
+
+    async def ingest(message):
+        # what /mailtrap/fetch does: claim the message in the transaction that stores it
+        async with db.async_session_scope() as sess:
+            await claim_message(sess, SOURCE, message["id"])
+        await asyncio.sleep(0)
+        ingested.append(message["id"])
+
+    async def scenario():
+        eng = _file_db(monkeypatch, tmp_path)
+        first = _reader(api, concurrency=4, cursor_source=SOURCE)
+        await first.poll(ingest)
+        await first.aclose()
+
+        api.add(40)
+        # a restarted process and a second worker start polling at the same time
+        workers = [_reader(api, concurrency=4, cursor_source=SOURCE) for _ in range(2)]
+        try:
+            await asyncio.gather(*(w.poll(ingest) for w in workers))
+            assert [await w.poll(ingest) for w in workers] == [[], []]
+        finally:
+            for w in workers:
+                await w.aclose()
+            await eng.dispose()
+
+    asyncio.run(scenario())
+    assert sorted(ingested) == list(range(1001, 1051))
@@ -0,0 +1,23 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from app.match_cache import MatchCache, approx_size
+
+
+def test_match_cache_lru_budget_and_ttl():
+    entry = approx_size(("k", 0)) + approx_size("x" * 100)
+    cache = MatchCache(max_bytes=entry * 2 + 10, ttl_seconds=60)
+    cache.put(("k", 0), "x" * 100)
+    cache.put(("k", 1), "x" * 100)
+    assert cache.get(("k", 0)) is not None  # refreshes k0, so k1 is the LRU entry
+    cache.put(("k", 2), "x" * 100)
+    assert cache.get(("k", 1)) is None
+    assert cache.get(("k", 2)) is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["bytes"] <= stats["max_bytes"]
+
+    expiring = MatchCache(max_bytes=1 << 20, ttl_seconds=0)
+    expiring.put("k", 1)
+    assert expiring.get("k") is None
+    assert expiring.stats()["expirations"] == 1
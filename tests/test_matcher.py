@@ -47,4 +47,4 @@ def test_calculate_match_score_no_match():
         "polled_at": datetime.now(),
     }
     score = calculate_match_score(alert, polled)
-    assert score < 0.3
\ No newline at end of file
+    assert score < 0.3
@@ -0,0 +1,46 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import random
+from rapidfuzz import fuzz, process
+from app.merchant_index import MerchantIndex, normalize_description
+
+
+def _names(count, seed=3):
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return list({" ".join("".join(rng.choice(letters) for _ in range(rng.randint(4, 8)))
+                          for _ in range(rng.randint(1, 3))) for _ in range(count)})
+
+
+def test_add_is_idempotent_and_normalizes():
+    index = MerchantIndex()
+    assert index.add("  Starbucks   Lekki ") == index.add("STARBUCKS LEKKI")
+    assert index.add("") is None and index.add(None) is None
+    assert len(index) == 1 and "starbucks lekki" in index
+    index.clear()
+    assert len(index) == 0 and index.search("starbucks") == []
+
+
+def test_small_index_is_scanned_exactly():
+    names = _names(500)
+    index = MerchantIndex()
+    index.add_many(names)
+    query = names[7][:-1] + "x"
+    expected = process.extract(query, names, scorer=fuzz.ratio, score_cutoff=50, limit=None)
+    assert index.similarities(query, cutoff=50) == {n: float(s) for n, s, _ in expected}
+
+
+def test_large_index_finds_near_matches_from_posting_lists():
+    names = _names(20000)
+    index = MerchantIndex(exhaustive_limit=1000)
+    index.add_many(names)
+    rng = random.Random(11)
+    for name in rng.sample([n for n in names if len(n) >= 10], 50):
+        query = name[:3] + name[4:]
+        results = index.search(query.upper(), limit=5, cutoff=70)
+        assert results and results[0][1] >= fuzz.ratio(normalize_description(query), name)
+        assert all(score >= 70 for _, score in results)
+
+    # names added later are searchable straight away
+    index.add("Zzyzx Quixotic Vendors")
+    assert index.search("zzyzx quixotic vendor", limit=1)[0][0] == "zzyzx quixotic vendors"
@@ -0,0 +1,124 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import json
+from datetime import datetime, timedelta
+from sqlmodel import SQLModel, Session, select
+from app.db import build_engine
+from app.models import EmailAlert, MatchRun, Transaction
+from app.rematch import alert_windows, load_window_transactions, rescore_chunk, run_rematch
+
+
+def _seed(engine, count):
+    base = datetime(2025, 11, 3, 9, 0, 0)
+    with Session(engine) as sess:
+        for i in range(count):
+            ref = f"REF{i:04d}"
+            at = base + timedelta(minutes=10 * i)
+            sess.add(Transaction(id=f"tx-{i}", timestamp=at - timedelta(minutes=1), merchant="Shoprite",
+                                 amount=100.0 + i, extra_data=json.dumps({"reference": ref})))
+            sess.add(EmailAlert(id=f"eml-{i:04d}", received_at=at, raw_subject="Shoprite Debit Alert", raw_from="bank",
+                                raw_body=f"Debited NGN {100 + i}.00 Ref: {ref}"))
+            sess.add(MatchRun(id=f"run-old-{i}", email_id=f"eml-{i:04d}", status="no_match", created_at=at))
+        sess.commit()
+
+
+def test_rematch_writes_runs_reports_diff_and_resumes(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'rematch.db'}")
+    SQLModel.metadata.create_all(engine)
+    _seed(engine, 7)
+    report = tmp_path / "report.jsonl"
+    checkpoint = tmp_path / "rematch.ckpt"
+
+    stats = run_rematch(engine, chunk_size=3, workers=1, write=True,
+                        report_path=str(report), checkpoint_path=str(checkpoint))
+    assert stats["processed"] == 7
+    assert stats["written"] == 7
+    assert stats["changed"] == 7
+
+    lines = [json.loads(line) for line in report.read_text().splitlines()]
+    assert [l["email_id"] for l in lines] == [f"eml-{i:04d}" for i in range(7)]
+    assert lines[0]["old"]["status"] == "no_match"
+    assert lines[0]["new"] == {"status": "matched", "chosen_tx_id": "tx-0", "score": lines[0]["new"]["score"]}
+
+    with Session(engine) as sess:
+        reruns = sess.exec(select(MatchRun).where(MatchRun.note == "rematch")).all()
+    assert len(reruns) == 7
+
+    # everything is behind the checkpoint, so a second run has nothing left to do
+    again = run_rematch(engine, chunk_size=3, workers=1, write=True, checkpoint_path=str(checkpoint))
+    assert again["processed"] == 0
+
+
+def test_resume_after_crash_between_commit_and_checkpoint_does_not_duplicate_runs(tmp_path, monkeypatch):
+    from app import rematch
+    engine = build_engine(f"sqlite:///{tmp_path / 'crash.db'}")
+    SQLModel.metadata.create_all(engine)
+    _seed(engine, 7)
+    checkpoint = tmp_path / "rematch.ckpt"
+
+    real_save = rematch.save_checkpoint
+    calls = []
+    def crash_on_second_chunk(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise KeyboardInterrupt  # runs of the second chunk are committed, its checkpoint is not
+        real_save(*args)
+    monkeypatch.setattr(rematch, "save_checkpoint", crash_on_second_chunk)
+    try:
+        run_rematch(engine, chunk_size=3, workers=1, write=True, checkpoint_path=str(checkpoint))
+    except KeyboardInterrupt:
+        pass
+    monkeypatch.setattr(rematch, "save_checkpoint", real_save)
+
+    resumed = run_rematch(engine, chunk_size=3, workers=1, write=True, checkpoint_path=str(checkpoint))
+    assert resumed["skipped"] == 3
+    assert resumed["written"] == 1
+    with Session(engine) as sess:
+        reruns = sess.exec(select(MatchRun.email_id).where(MatchRun.note == "rematch")).all()
+    assert sorted(reruns) == [f"eml-{i:04d}" for i in range(7)]
+
+
+def test_rematch_queries_are_indexed(tmp_path):
+    from sqlalchemy import inspect
+    engine = build_engine(f"sqlite:///{tmp_path / 'idx.db'}")
+    SQLModel.metadata.create_all(engine)
+    insp = inspect(engine)
+    assert any(ix["column_names"] == ["received_at", "id"] for ix in insp.get_indexes("emailalert"))
+    assert any(ix["column_names"] == ["timestamp"] for ix in insp.get_indexes("transaction"))
+    assert any(ix["column_names"] == ["email_id"] for ix in insp.get_indexes("matchrun"))
+
+
+def test_rescore_uses_the_same_account_partitioning_as_ingestion():
+    at = datetime(2025, 11, 3, 12, 0, 0)
+    alert = {"id": "eml-x", "received_at": at, "raw_subject": "Shoprite Debit Alert",
+             "raw_body": "Debited NGN 150.00 from ****1111 on 2025-11-03"}
+    own = {"id": "tx-own", "timestamp": at - timedelta(minutes=30), "account_masked": "****1111",
+           "merchant": "Shoprite", "amount": 140.0, "metadata": None}
+    other = {"id": "tx-other", "timestamp": at - timedelta(minutes=1), "account_masked": "****2222",
+             "merchant": "Shoprite", "amount": 150.0, "metadata": None}
+    (result,) = rescore_chunk([alert], [own, other], 24.0)
+    assert [c["tx_id"] for c in result["candidates"]] == ["tx-own"]
+
+    # a bare four-digit run (here the year) does not narrow the candidates
+    alert["raw_body"] = "Debited NGN 150.00 on 2025-11-03"
+    (result,) = rescore_chunk([alert], [own, other], 24.0)
+    assert result["chosen_tx_id"] == "tx-other"
+
+
+def test_sparse_chunks_only_load_transactions_inside_alert_windows(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'sparse.db'}")
+    SQLModel.metadata.create_all(engine)
+    base = datetime(2025, 8, 1)
+    with Session(engine) as sess:
+        for hour in range(24 * 90):
+            sess.add(Transaction(id=f"tx-{hour}", timestamp=base + timedelta(hours=hour), amount=1.0))
+        sess.commit()
+
+    # three alerts six weeks apart, two of them with overlapping windows
+    received = [base + timedelta(days=10), base + timedelta(days=10, hours=6), base + timedelta(days=52)]
+    intervals = alert_windows(received, timedelta(hours=24))
+    assert intervals == [(received[0] - timedelta(hours=24), received[1]),
+                         (received[2] - timedelta(hours=24), received[2])]
+    with Session(engine) as sess:
+        loaded = load_window_transactions(sess, intervals)
+    assert len(loaded) == (30 + 1) + (24 + 1)
@@ -0,0 +1,101 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import asyncio
+from datetime import datetime, timedelta
+from app.shards import AccountShardIndex, AccountShards, account_candidates, account_key, alert_account_key
+
+NOW = datetime(2025, 11, 3, 12, 0, 0)
+
+
+def _tx(tx_id, account, minutes_ago, amount=10.0):
+    return {"id": tx_id, "timestamp": NOW - timedelta(minutes=minutes_ago), "account_masked": account,
+            "merchant": "Shoprite", "amount": amount, "currency": "NGN", "metadata": None}
+
+
+TRANSACTIONS = [
+    _tx("a1", "****1234", 5), _tx("a2", "****1234", 30), _tx("b1", "****5678", 10),
+    _tx("c1", None, 15), _tx("old", "****1234", 60 * 30),
+]
+
+
+def test_account_key_normalizes_masks():
+    assert account_key("****1234") == account_key("***1234") == account_key("1234") == "1234"
+    assert account_key(None) is None
+    assert account_key("****") is None
+
+
+def test_index_returns_account_shard_and_falls_back_to_window():
+    index = AccountShardIndex()
+    index.add(TRANSACTIONS)
+    cutoff = NOW - timedelta(hours=24)
+    assert [tx["id"] for tx in index.candidates("1234", cutoff)] == ["a2", "a1"]
+    assert sorted(tx["id"] for tx in index.candidates(None, cutoff)) == ["a1", "a2", "b1", "c1"]
+    assert sorted(tx["id"] for tx in index.candidates("9999", cutoff)) == ["a1", "a2", "b1", "c1"]
+    assert len(index) == 4  # the out-of-window transaction was pruned
+
+
+def test_worker_processes_score_only_the_owning_shard():
+    async def scenario():
+        shards = AccountShards(workers=2)
+        try:
+            await shards.load(TRANSACTIONS)
+            cutoff = NOW - timedelta(hours=24)
+            parsed = {"amount": 10.0, "merchant": "Shoprite", "reference": None, "received_at": NOW}
+            own = await shards.score(parsed, "***5678", cutoff)
+            everything = await shards.score(parsed, None, cutoff)
+            return own, everything
+        finally:
+            shards.close()
+
+    own, everything = asyncio.run(scenario())
+    assert [tx["id"] for tx, _ in own] == ["b1"]
+    assert sorted(tx["id"] for tx, _ in everything) == ["a1", "a2", "b1", "c1"]
+
+
+def test_only_real_masks_partition_alerts():
+    assert alert_account_key("****1234") == alert_account_key("*** 1234") == "1234"
+    # bare digit runs from the parser are usually a year or an amount
+    assert alert_account_key("2025") is None
+    assert alert_account_key("***12") is None
+    assert alert_account_key(None) is None
+    assert [tx["id"] for tx in account_candidates(TRANSACTIONS, "5678")] == ["b1"]
+    assert account_candidates(TRANSACTIONS, None) == TRANSACTIONS
+    assert account_candidates(TRANSACTIONS, "4321") == TRANSACTIONS
+
+
+def test_inactive_shards_are_pruned_even_when_never_looked_up():
+    index = AccountShardIndex()
+    index.add(TRANSACTIONS)
+    index.shard("1234", NOW - timedelta(hours=24))
+    assert len(index) == 4
+    # a day later only account 1234 is being looked up, but 5678 and the unmasked shard expire too
+    later = NOW + timedelta(hours=24)
+    index.add([_tx("a3", "****1234", -(60 * 23))])
+    assert [tx["id"] for tx in index.shard("1234", later - timedelta(hours=24))] == ["a3"]
+    assert len(index) == 1
+
+
+def test_invalidated_shards_reload_from_the_source():
+    rows = [TRANSACTIONS[0]]
+
+    async def fetch():
+        return list(rows)
+
+    async def scenario():
+        shards = AccountShards()
+        await shards.ensure_loaded(fetch)
+        cutoff = NOW - timedelta(hours=24)
+        parsed = {"amount": 10.0, "merchant": "Shoprite", "reference": None, "received_at": NOW}
+        before = await shards.score(parsed, None, cutoff)
+        rows.append(TRANSACTIONS[2])
+        await shards.ensure_loaded(fetch)  # still current, nothing re-read
+        unchanged = await shards.score(parsed, None, cutoff)
+        shards.invalidate()
+        await shards.ensure_loaded(fetch)
+        after = await shards.score(parsed, None, cutoff)
+        return before, unchanged, after
+
+    before, unchanged, after = asyncio.run(scenario())
+    assert [tx["id"] for tx, _ in before] == ["a1"]
+    assert [tx["id"] for tx, _ in unchanged] == ["a1"]
+    assert sorted(tx["id"] for tx, _ in after) == ["a1", "b1"]